@@ -1,13 +1,33 @@
-from fastapi import FastAPI, Depends, HTTPException
+import hashlib
+import json
+import time
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy import select, func
-from models.models import Base, User, Level, Word, UsersWords
-from pydantic import BaseModel, ConfigDict
+from sqlalchemy import select, func, delete
+from sqlalchemy.dialects.sqlite import insert
+from models.models import Base, User, Level, Word, UsersWords, WordTranslation, ProgressBatchLog
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional
 from sqlalchemy import text 
+from app.word_index import WordSamplingIndex, LANGUAGES
+from app.migrations import migrate
+from ttl_cache import TTLCache, MISSING
 
 app = FastAPI()
 
+# Random words are picked from memory, kept in sync by create_word/update_word
+word_index = WordSamplingIndex()
+MAX_RANDOM_WORDS = 100
+MAX_BULK_WORDS = 1000
+# Long enough for any client to give up retrying a progress batch
+PROGRESS_BATCH_RETENTION = 24 * 3600
+
+# Reference data, loaded by initialize_database and reloaded when it changes
+level_ids: set[str] = set()
+# user id -> (serialized profile, ETag), invalidated by create_user
+USER_CACHE_SIZE = 10_000
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=None)
+
 # Async Engine Setup
 engine = create_async_engine(
     'sqlite+aiosqlite:///database.db',
@@ -22,6 +42,52 @@ async def get_db():
     async with AsyncSessionLocal() as db:
         yield db
 
+async def load_reference_data(db: AsyncSession):
+    result = await db.execute(select(Level.level_id))
+    level_ids.clear()
+    level_ids.update(result.scalars())
+
+def check_level(level_id: str):
+    if level_id not in level_ids:
+        raise HTTPException(status_code=400, detail="Invalid level ID")
+
+def etag_for(body: bytes) -> str:
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+def conditional_response(request: Request, body: bytes, etag: str) -> Response:
+    """304 without a body if the client already has this version"""
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+async def sync_translations(db: AsyncSession, words: list[Word]) -> dict[int, dict[str, str]]:
+    """Mirror the language columns of the words into word_translations, returns the rows
+    written as word id -> {language: translation}"""
+    word_ids = [word.word_id for word in words]
+    await db.execute(delete(WordTranslation).where(WordTranslation.word_id.in_(word_ids)))
+    rows = [{"word_id": word.word_id, "lang": lang, "text": word[lang]}
+            for word in words for lang in LANGUAGES if word[lang] is not None]
+    if rows:
+        await db.execute(insert(WordTranslation).values(rows))
+
+    translations = {word_id: {} for word_id in word_ids}
+    for row in rows:
+        translations[row["word_id"]][row["lang"]] = row["text"]
+    return translations
+
+def index_words(words: list[Word], translations: dict[int, dict[str, str]]):
+    # The index holds what word_translations holds, not the language columns
+    for word in words:
+        word_index.upsert(word.word_id, word.level_id, word.de, translations[word.word_id])
+
+async def load_word_index(db: AsyncSession):
+    result = await db.execute(
+        select(Word.word_id, Word.level_id, Word.de, WordTranslation.lang, WordTranslation.text)
+        .outerjoin(WordTranslation, WordTranslation.word_id == Word.word_id)
+        .order_by(Word.word_id)
+    )
+    word_index.load(result.all())
+
 # Pydantic models
 class UserCreate(BaseModel):
     user_id: str
@@ -47,6 +113,20 @@ class WordCreate(BaseModel):
     ua: Optional[str] = None
     ru: Optional[str] = None
 
+class WordBulkItem(BaseModel):
+    de: str
+    en: Optional[str] = None
+    es: Optional[str] = None
+    ua: Optional[str] = None
+    ru: Optional[str] = None
+
+class WordBulkCreate(BaseModel):
+    level_id: str
+    words: list[WordBulkItem] = Field(max_length=MAX_BULK_WORDS)
+
+class WordBulkResponse(BaseModel):
+    count: int
+
 class WordUpdate(BaseModel):
     level_id: str
     en: Optional[str] = None
@@ -65,6 +145,24 @@ class WordResponse(BaseModel):
     
     model_config = ConfigDict(from_attributes=True)
 
+class ProgressItem(BaseModel):
+    user_id: str
+    word_id: int
+    count: int = Field(ge=1)
+
+class ProgressBatch(BaseModel):
+    # Sent again with the same id when the client didn't get our answer
+    batch_id: Optional[str] = Field(default=None, max_length=64)
+    progress: list[ProgressItem] = Field(max_length=MAX_BULK_WORDS)
+
+class ProgressBatchResponse(BaseModel):
+    count: int
+
+class WordCoverage(BaseModel):
+    lang: str
+    level: str
+    count: int
+
 class WordTranslationCheck(BaseModel):
     has_translation: bool
 
@@ -80,38 +178,77 @@ async def root():
 
 @app.post("/users/create", response_model=UserResponse)
 async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Level).where(Level.level_id == user.level_id))
-    if not result.scalars().first():
-        raise HTTPException(status_code=400, detail="Invalid level ID")
-    
+    check_level(user.level_id)
+
     db_user = User(**user.model_dump())
     db.add(db_user)
-    await db.commit()
+    try:
+        await db.commit()
+    finally:
+        user_cache.invalidate(user.user_id)
     await db.refresh(db_user)
     return db_user
 
 @app.get("/users/{user_id}", response_model=UserResponse)
-async def read_user(user_id: str, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(User).where(User.user_id == user_id))
-    user = result.scalars().first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+async def read_user(user_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    cached = user_cache.get(user_id)
+    if cached is MISSING:
+        result = await db.execute(select(User).where(User.user_id == user_id))
+        user = result.scalars().first()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        body = UserResponse.model_validate(user).model_dump_json().encode()
+        cached = (body, etag_for(body))
+        user_cache.set(user_id, cached)
+
+    return conditional_response(request, *cached)
 
 @app.post("/words/create/", response_model=WordResponse, status_code=201)
 async def create_word(word: WordCreate, db: AsyncSession = Depends(get_db)):
     # Überprüfe ob level existiert
-    level_exists = await db.execute(select(Level).where(Level.level_id == word.level_id))
-    if not level_exists.scalars().first():
-        raise HTTPException(status_code=400, detail="Invalid level ID")
-    
+    check_level(word.level_id)
+
     word_data = {k: v for k, v in word.dict().items() if v is not None}
     db_word = Word(**word_data)
     db.add(db_word)
+    await db.flush()
+    translations = await sync_translations(db, [db_word])
     await db.commit()
     await db.refresh(db_word)
+    index_words([db_word], translations)
     return db_word
 
+@app.post("/words/bulk", response_model=WordBulkResponse)
+async def create_words(bulk: WordBulkCreate, db: AsyncSession = Depends(get_db)):
+    check_level(bulk.level_id)
+
+    # Merge duplicates within the request, later translations win
+    rows: dict[str, dict] = {}
+    for word in bulk.words:
+        row = rows.setdefault(word.de, {"level_id": bulk.level_id, "de": word.de})
+        row.update(word.model_dump(exclude={"de"}, exclude_none=True))
+    if not rows:
+        return {"count": 0}
+
+    # Existing words keep their level and get the new translations, one transaction
+    statement = insert(Word).values([
+        {lang: row.get(lang) for lang in LANGUAGES} | row for row in rows.values()
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[Word.de],
+        set_={lang: func.coalesce(statement.excluded[lang], Word.__table__.c[lang])
+              for lang in LANGUAGES}
+    )
+    await db.execute(statement)
+    result = await db.execute(select(Word).where(Word.de.in_(rows.keys())))
+    words = result.scalars().all()
+    translations = await sync_translations(db, words)
+    await db.commit()
+
+    index_words(words, translations)
+    return {"count": len(words)}
+
 @app.patch("/words/update/{word_de}", response_model=WordResponse)
 async def update_word(
     word_de: str,
@@ -142,82 +279,82 @@ async def update_word(
     update_data = word_update.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(db_word, field, value)
-    
+    if "level_id" in update_data:
+        db_word.level_id = db_word.level_id.lower()
+
+    translations = await sync_translations(db, [db_word])
     await db.commit()
     await db.refresh(db_word)
+    index_words([db_word], translations)
     return db_word
 
-@app.get("/words/translation/{to_code2}/{level}", response_model=WordTranslationCheck)
-async def check_translation(
-    to_code2: str,
-    level: str,
-    db: AsyncSession = Depends(get_db)
-):
-    # Validate target language
-    valid_languages = ['en', 'es', 'ua', 'ru']
-    if to_code2 not in valid_languages:
+@app.get("/words/coverage", response_model=list[WordCoverage])
+async def get_coverage(request: Request):
+    # Served from the sampling index, which is kept up to date on every write
+    coverage = [WordCoverage(lang=lang, level=level, count=count)
+                for (lang, level), count in sorted(word_index.coverage().items())]
+    body = f"[{','.join(entry.model_dump_json() for entry in coverage)}]".encode()
+    return conditional_response(request, body, etag_for(body))
+
+@app.get("/words/coverage/{to_code2}/{level}", response_model=WordCoverage)
+async def get_level_coverage(to_code2: str, level: str, request: Request):
+    if to_code2 not in LANGUAGES:
         raise HTTPException(
             status_code=400,
-            detail=f"Invalid target language. Must be one of: {valid_languages}"
+            detail=f"Invalid target language. Must be one of: {LANGUAGES}"
         )
+    coverage = WordCoverage(lang=to_code2, level=level.lower(),
+                            count=word_index.count(to_code2, level))
+    body = coverage.model_dump_json().encode()
+    return conditional_response(request, body, etag_for(body))
 
-    # Find the word
-    result = await db.execute(
-        select(Word)
-        .where(func.lower(Word.level_id) == func.lower(level))
-    )
-    db_word = result.scalars().first()
+@app.get("/words/known/{to_code2}/{level}", response_model=list[str])
+async def get_known_words(to_code2: str, level: str, request: Request):
+    """German words that generators for to_code2 and level should skip, the newest last"""
+    if to_code2 not in LANGUAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid target language. Must be one of: {LANGUAGES}"
+        )
+    words = word_index.known_words(to_code2, level)
+    body = json.dumps(words, ensure_ascii=False).encode()
+    return conditional_response(request, body, etag_for(body))
 
-    if not db_word:
+@app.get("/words/translation/{to_code2}/{level}", response_model=WordTranslationCheck)
+async def check_translation(to_code2: str, level: str):
+    """Whether any word of the level has a translation, use /words/coverage for the count"""
+    if to_code2 not in LANGUAGES:
         raise HTTPException(
-            status_code=404,
-            detail=f"No translations for {to_code2}"
+            status_code=400,
+            detail=f"Invalid target language. Must be one of: {LANGUAGES}"
         )
-    return {
-        "has_translation": db_word[to_code2] is not None,
-    }
+    return {"has_translation": word_index.count(to_code2, level) > 0}
 
-@app.get("/words/random/{to_code2}", response_model=WordRandomResponse)
+@app.get(
+    "/words/random/{to_code2}",
+    response_model=WordRandomResponse | list[WordRandomResponse]
+)
 async def get_random_word(
     to_code2: str,
-    db: AsyncSession = Depends(get_db),
-    # Max tray
-    max_attempts: int = 10
+    level: Optional[str] = None,
+    # Batch mode: a list of up to `count` distinct words instead of a single one
+    count: Optional[int] = Query(None, ge=1, le=MAX_RANDOM_WORDS)
 ):
-    valid_languages = ['en', 'es', 'ua', 'ru']
-    if to_code2 not in valid_languages:
+    if to_code2 not in LANGUAGES:
         raise HTTPException(
             status_code=400,
-            detail=f"Invalid language code. Must be one of: {valid_languages}"
+            detail=f"Invalid language code. Must be one of: {LANGUAGES}"
         )
 
-    attempt = 0
-    while attempt < max_attempts:
-        result = await db.execute(
-            select(Word)
-            .where(getattr(Word, to_code2) != None)
-            .order_by(func.random())
-            .limit(1)
+    words = word_index.sample(to_code2, level, count or 1)
+
+    if not words:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No words with valid {to_code2} translation found"
         )
-        random_word = result.scalars().first()
-
-        # Check 'translation' is not empty
-        if random_word:
-            translation = getattr(random_word, to_code2)
-            if translation and str(translation).strip():
-                return {
-                    "word_id": random_word.word_id,
-                    "de": random_word.de,
-                    "translation": translation
-                }
-
-        attempt += 1
-
-    # Falls keine gültige Übersetzung gefunden wurde
-    raise HTTPException(
-        status_code=404,
-        detail=f"No words with valid {to_code2} translation found after {max_attempts} attempts"
-    )
+
+    return words if count is not None else words[0]
 
 
 @app.post("/words/update_correct_count/{user_id}/{word_id}")
@@ -253,6 +390,38 @@ async def increment_correct_count(
         "new_count": user_word.correct_count
     }
     
+@app.post("/words/progress/batch", response_model=ProgressBatchResponse)
+async def increment_correct_counts(batch: ProgressBatch, db: AsyncSession = Depends(get_db)):
+    if not batch.progress:
+        return {"count": 0}
+
+    if batch.batch_id is not None:
+        now = time.time()
+        await db.execute(delete(ProgressBatchLog)
+                         .where(ProgressBatchLog.created_at < now - PROGRESS_BATCH_RETENTION))
+        result = await db.execute(
+            insert(ProgressBatchLog).values(batch_id=batch.batch_id, created_at=now)
+            .on_conflict_do_nothing()
+        )
+        if result.rowcount == 0:
+            # Applied before, only the answer got lost
+            await db.commit()
+            return {"count": len(batch.progress)}
+
+    # One statement adds all increments, missing entries in users_words are created
+    statement = insert(UsersWords).values([
+        {"user_id": item.user_id, "word_id": item.word_id, "correct_count": item.count}
+        for item in batch.progress
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[UsersWords.user_id, UsersWords.word_id],
+        set_={"correct_count": func.coalesce(UsersWords.correct_count, 0)
+                               + statement.excluded.correct_count}
+    )
+    await db.execute(statement)
+    await db.commit()
+    return {"count": len(batch.progress)}
+
 @app.on_event("startup")
 async def startup_event():
     await initialize_database()
@@ -263,6 +432,7 @@ async def initialize_database():
         async with engine.begin() as conn:
             await conn.execute(text("PRAGMA foreign_keys=ON"))
             await conn.run_sync(Base.metadata.create_all)
+            await migrate(conn)
             print("Tables created successfully")
 
         # Add levels data
@@ -280,6 +450,11 @@ async def initialize_database():
                 await db.commit()
                 print("Levels data added successfully")
 
+            await load_reference_data(db)
+
+            await load_word_index(db)
+            print("Word sampling index built")
+
     except Exception as e:
         print(f"Critical initialization error: {str(e)}")
         raise
@@ -0,0 +1,36 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.word_index import LANGUAGES
+
+# Indexes on tables that existed before them, create_all() only creates missing tables
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_words_level_id ON words (level_id)",
+    "CREATE INDEX IF NOT EXISTS ix_words_de_lower ON words (lower(de))",
+]
+
+
+async def migrate(conn: AsyncConnection):
+    """Bring an existing database up to date, safe to run on every startup"""
+    for statement in INDEXES:
+        await conn.execute(text(statement))
+
+    # Level lookups compare against the lower case key
+    await conn.execute(text(
+        "UPDATE words SET level_id = lower(level_id) WHERE level_id <> lower(level_id)"
+    ))
+
+    # Copy the per-language columns into word_translations once, later writes go to both
+    result = await conn.execute(text("SELECT 1 FROM word_translations LIMIT 1"))
+    if result.first():
+        return
+
+    migrated = 0
+    for lang in LANGUAGES:
+        result = await conn.execute(text(
+            f"INSERT OR IGNORE INTO word_translations (word_id, lang, text) "
+            f"SELECT word_id, '{lang}', {lang} FROM words WHERE {lang} IS NOT NULL"
+        ))
+        migrated += result.rowcount
+    if migrated:
+        print(f"{migrated} translations migrated to word_translations")
@@ -0,0 +1,109 @@
+import itertools
+import random
+from collections.abc import Iterable
+
+LANGUAGES = ['en', 'es', 'ua', 'ru']
+
+
+class WordSamplingIndex:
+    """
+    In-memory index of the words that have a non-empty translation, grouped by
+    (language, level). Picking random words costs O(1) per word and needs no SQL.
+    Built from word_translations, so any language stored there can be served.
+    """
+
+    def __init__(self):
+        # (language, level) -> word ids, position lookup for O(1) removal
+        self._ids: dict[tuple[str, str], list[int]] = {}
+        self._positions: dict[tuple[str, str], dict[int, int]] = {}
+        # word id -> (level, de, {language: translation})
+        self._words: dict[int, tuple[str, str, dict[str, str]]] = {}
+
+    def load(self, rows: Iterable[tuple[int, str, str, str | None, str | None]]):
+        """(word id, level, de, language, translation) rows ordered by word id, a word
+        without translations comes as one row with language and translation None"""
+        self._ids.clear()
+        self._positions.clear()
+        self._words.clear()
+        for word_id, word_rows in itertools.groupby(rows, key=lambda row: row[0]):
+            word_rows = list(word_rows)
+            _, level, de, _, _ = word_rows[0]
+            self.upsert(word_id, level, de,
+                        {lang: text for _, _, _, lang, text in word_rows if lang})
+
+    def upsert(self, word_id: int, level: str | None, de: str, translations: dict[str, str]):
+        self.remove(word_id)
+
+        level = str(level or "").lower()
+        translations = {lang: translation for lang, translation in translations.items()
+                        if translation and str(translation).strip()}
+        for lang in translations:
+            self._add((lang, level), word_id)
+
+        self._words[word_id] = (level, de, translations)
+
+    def remove(self, word_id: int):
+        entry = self._words.pop(word_id, None)
+        if not entry:
+            return
+
+        level, _, translations = entry
+        for lang in translations:
+            self._discard((lang, level), word_id)
+
+    def count(self, lang: str, level: str) -> int:
+        return len(self._ids.get((lang, level.lower()), ()))
+
+    def coverage(self) -> dict[tuple[str, str], int]:
+        """(language, level) -> number of words with a translation"""
+        return {key: len(ids) for key, ids in self._ids.items() if ids}
+
+    def known_words(self, lang: str, level: str) -> list[str]:
+        """
+        German words that can't be added to the deck of lang and level: German words are
+        unique, so everything on another level, and words of the level already translated.
+        Ordered by word id, the newest last
+        """
+        level = level.lower()
+        return [de for _, (word_level, de, translations) in sorted(self._words.items())
+                if word_level != level or lang in translations]
+
+    def sample(self, lang: str, level: str | None = None, count: int = 1) -> list[dict]:
+        """Up to `count` distinct random words, from all levels if none is given"""
+        if level is not None:
+            keys = [(lang, level.lower())]
+        else:
+            keys = [key for key in self._ids if key[0] == lang]
+
+        sizes = [len(self._ids.get(key, ())) for key in keys]
+        total = sum(sizes)
+        if not total:
+            return []
+
+        words = []
+        for position in random.sample(range(total), min(count, total)):
+            for key, size in zip(keys, sizes):
+                if position < size:
+                    word_id = self._ids[key][position]
+                    break
+                position -= size
+
+            _, de, translations = self._words[word_id]
+            words.append({"word_id": word_id, "de": de, "translation": translations[lang]})
+
+        return words
+
+    def _add(self, key: tuple[str, str], word_id: int):
+        ids = self._ids.setdefault(key, [])
+        self._positions.setdefault(key, {})[word_id] = len(ids)
+        ids.append(word_id)
+
+    def _discard(self, key: tuple[str, str], word_id: int):
+        ids = self._ids[key]
+        positions = self._positions[key]
+        position = positions.pop(word_id)
+        # Swap the last id into the gap
+        last_id = ids.pop()
+        if last_id != word_id:
+            ids[position] = last_id
+            positions[last_id] = position
@@ -0,0 +1,137 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from twilio.rest.conversations.v1.service.conversation.message import MessageInstance
+
+from twilio_client import TwilioClient, ConversationContext
+from metrics import STAGE_DURATION, STAGE_ERRORS
+
+
+class AsyncTwilioClient(TwilioClient):
+    """
+    Polls with asyncio and gives every conversation its own ordered inbox.
+    Different conversations are handled concurrently, up to max_concurrency at a time.
+    """
+    MAX_CONCURRENCY = 8
+
+    def __init__(self, *, max_concurrency: int = MAX_CONCURRENCY, **kwargs):
+        super().__init__(**kwargs)
+        self._max_concurrency = max_concurrency
+        self._inboxes: dict[str, asyncio.Queue[MessageInstance]] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+        self._executor: ThreadPoolExecutor | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopped: asyncio.Event | None = None
+
+    async def start_polling(self):
+        if not self._message_handler or not self._command_handler:
+            raise AttributeError(
+                "Message handler & command handler must be defined before start polling"
+            )
+
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        # Handlers block (HTTP calls to DB, DeepL, OpenAI), so they run on a bounded pool
+        self._executor = ThreadPoolExecutor(max_workers=self._max_concurrency)
+
+        await asyncio.to_thread(self._registry.refresh)
+        self._registry.start()
+        # Conversations known at startup only get messages sent from now on
+        known_at_startup = set(self._registry.sids())
+        print(f"Started polling new messages "
+              f"with up to {self._max_concurrency} concurrent conversations...")
+        polls: set[asyncio.Task] = set()
+        last_sync = float("-inf")
+
+        try:
+            while not self._stopped.is_set():
+                if time.monotonic() - last_sync >= TwilioClient.SYNC_INTERVAL:
+                    try:
+                        sids = await asyncio.to_thread(self._get_owned_conversations)
+                        self._scheduler.sync(sids)
+                    except Exception as e:
+                        print(f"Error syncing conversations: {e}")
+                    last_sync = time.monotonic()
+
+                sid, wait = self._scheduler.next_due()
+                if sid is None:
+                    try:
+                        await asyncio.wait_for(
+                            self._stopped.wait(), timeout=min(wait, TwilioClient.SYNC_INTERVAL)
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                # Polls of different conversations overlap, the scheduler keeps them in budget
+                poll = asyncio.create_task(self._poll_conversation(sid, sid in known_at_startup))
+                polls.add(poll)
+                poll.add_done_callback(polls.discard)
+        finally:
+            self._registry.stop()
+            await asyncio.gather(*polls, return_exceptions=True)
+            # Let every inbox finish what was already fetched
+            await asyncio.gather(*self._workers.values(), return_exceptions=True)
+            self._executor.shutdown()
+
+        print("Stopped polling")
+
+    def stop_polling(self):
+        """Safe to call from any thread"""
+        if self._loop and self._stopped:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    async def _poll_conversation(self, sid: str, skip_history: bool):
+        messages = []
+        conversation_context = None
+        failed = False
+        start = time.perf_counter()
+
+        try:
+            conversation_context = await asyncio.to_thread(
+                self._get_conversation_context, sid, skip_history=skip_history
+            )
+
+            messages = await asyncio.to_thread(self._fetch_new_messages, conversation_context)
+            if messages:
+                # Queued messages count as seen so the next poll does not fetch them again
+                conversation_context.advance(messages[-1].index)
+                inbox = self._get_inbox(conversation_context)
+                for message in messages:
+                    inbox.put_nowait(message)
+        except Exception as e:
+            failed = True
+            STAGE_ERRORS.inc(stage="twilio.poll")
+            print(f"Error polling {sid}: {e}")
+        finally:
+            STAGE_DURATION.observe(time.perf_counter() - start, stage="twilio.poll")
+            active = conversation_context is not None and conversation_context.is_active()
+            self._scheduler.report(sid, active=active, failed=failed,
+                                   had_messages=self._has_inbound(messages))
+
+    def _get_inbox(self, conversation_context: ConversationContext) -> asyncio.Queue:
+        sid = conversation_context.sid
+        inbox = self._inboxes.get(sid)
+
+        if inbox is None:
+            inbox = asyncio.Queue()
+            self._inboxes[sid] = inbox
+            self._workers[sid] = asyncio.create_task(
+                self._drain_inbox(conversation_context, inbox)
+            )
+
+        return inbox
+
+    async def _drain_inbox(self, conversation_context: ConversationContext, inbox: asyncio.Queue):
+        """Handle the messages of one conversation in order, then retire the worker"""
+        while not inbox.empty():
+            message = inbox.get_nowait()
+            try:
+                await self._loop.run_in_executor(
+                    self._executor, self._dispatch, conversation_context, message
+                )
+            except Exception as e:
+                print(f"Error handling message {message.index} in {conversation_context.sid}: {e}")
+
+        del self._inboxes[conversation_context.sid]
+        del self._workers[conversation_context.sid]
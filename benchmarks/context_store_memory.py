@@ -0,0 +1,67 @@
+"""
+Memory per 100k conversations: plain dict of live contexts vs. compact records vs. the
+LRU-bounded ConversationContextStore. Run from the project root:
+    python3 benchmarks/context_store_memory.py
+"""
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from twilio.rest import Client
+
+from constants import ConversationStatus, LearningLanguage, LearningLevel
+from context_store import ContextRecord, ConversationContextStore
+from twilio_client import ConversationContext
+
+CONVERSATIONS = 100_000
+STORE_CAPACITY = 10_000
+
+
+def make_context(service, i: int) -> ConversationContext:
+    sid = f"CH{i:032x}"
+    context = ConversationContext(sid, service.conversations(sid))
+    context.status = ConversationStatus.AUTHENTICATED
+    context.learning_lang = LearningLanguage.EN
+    context.learning_level = LearningLevel.EASY
+    context.current_exercise = {"word_id": i, "de": "Haus", "translation": "house"}
+    context.last_message_index = i % 500
+    return context
+
+
+def measure(label: str, build):
+    tracemalloc.start()
+    kept = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<45} {current / 2 ** 20:8.1f} MiB  {current / CONVERSATIONS:7.0f} B/conversation")
+    return kept
+
+
+def main():
+    service = Client("SKxxx", "secret", "ACxxx").conversations.v1.services("ISxxx")
+
+    measure("dict[str, ConversationContext]",
+            lambda: {c.sid: c for c in (make_context(service, i) for i in range(CONVERSATIONS))})
+    measure("dict[str, ContextRecord]",
+            lambda: {r.sid: r for r in (ContextRecord.from_context(make_context(service, i))
+                                        for i in range(CONVERSATIONS))})
+
+    with tempfile.TemporaryDirectory() as directory:
+        def build_store():
+            store = ConversationContextStore(
+                os.path.join(directory, "contexts.db"),
+                lambda sid: ConversationContext(sid, service.conversations(sid)),
+                capacity=STORE_CAPACITY
+            )
+            for i in range(CONVERSATIONS):
+                store.add(make_context(service, i))
+            return store
+
+        measure(f"ConversationContextStore (capacity {STORE_CAPACITY})", build_store)
+
+
+if __name__ == "__main__":
+    main()
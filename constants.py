@@ -34,6 +34,15 @@ class LearningLanguage(Enum):
         return self.value
 
 
+class ConversationStatus(Enum):
+    UNKNOWN = 0
+    UNAUTHENTICATED = 1
+    AUTHENTICATED = 2
+    SELECT_LANG = 3
+    SELECT_LEVEL = 4
+    INACTIVE = 5
+
+
 code_dict = {
     LearningLanguage.DE: "DE",
     LearningLanguage.EN: "EN",
@@ -0,0 +1,133 @@
+import json
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+from constants import LearningLanguage, LearningLevel, ConversationStatus
+from sqlite_connection import SharedConnection
+
+if TYPE_CHECKING:
+    from twilio_client import ConversationContext
+
+
+class ContextRecord:
+    """The part of a ConversationContext that survives eviction and restarts"""
+    __slots__ = ("sid", "status", "learning_lang", "learning_level", "current_exercise",
+                 "last_message_index")
+
+    def __init__(self, sid: str, status: ConversationStatus,
+                 learning_lang: LearningLanguage | None, learning_level: LearningLevel | None,
+                 current_exercise: dict | None, last_message_index: int | None):
+        self.sid = sid
+        self.status = status
+        self.learning_lang = learning_lang
+        self.learning_level = learning_level
+        self.current_exercise = current_exercise
+        self.last_message_index = last_message_index
+
+    @classmethod
+    def from_context(cls, context: "ConversationContext"):
+        return cls(context.sid, context.status, context.learning_lang, context.learning_level,
+                   context.current_exercise, context.last_message_index)
+
+    def apply_to(self, context: "ConversationContext"):
+        context.status = self.status
+        context.learning_lang = self.learning_lang
+        context.learning_level = self.learning_level
+        context.current_exercise = self.current_exercise
+        context.last_message_index = self.last_message_index
+
+    def to_row(self) -> tuple:
+        return (
+            self.sid,
+            self.status.name,
+            self.learning_lang.name if self.learning_lang else None,
+            self.learning_level.name if self.learning_level else None,
+            json.dumps(self.current_exercise) if self.current_exercise else None,
+            self.last_message_index,
+        )
+
+    @classmethod
+    def from_row(cls, row: tuple):
+        sid, status, learning_lang, learning_level, current_exercise, last_message_index = row
+        return cls(
+            sid,
+            ConversationStatus[status],
+            LearningLanguage.from_str(learning_lang) if learning_lang else None,
+            LearningLevel.from_str(learning_level) if learning_level else None,
+            json.loads(current_exercise) if current_exercise else None,
+            last_message_index,
+        )
+
+
+class ConversationContextStore:
+    """
+    Keeps at most `capacity` live ConversationContexts in memory (LRU) and persists their
+    records in SQLite. Evicted or restarted conversations are rehydrated on their next access.
+    """
+    CAPACITY = 10_000
+
+    def __init__(self, path: str, create_context: Callable[[str], "ConversationContext"], *,
+                 capacity: int = CAPACITY):
+        self._create_context = create_context
+        self._capacity = capacity
+        self._contexts: OrderedDict[str, "ConversationContext"] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = SharedConnection(path, """
+            CREATE TABLE IF NOT EXISTS conversation_contexts (
+                sid TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                learning_lang TEXT,
+                learning_level TEXT,
+                current_exercise TEXT,
+                last_message_index INTEGER
+            )
+        """)
+
+    def get(self, sid: str) -> "ConversationContext | None":
+        with self._lock:
+            context = self._contexts.get(sid)
+            if context:
+                self._contexts.move_to_end(sid)
+                return context
+
+        record = self.load_record(sid)
+        if not record:
+            return None
+
+        context = self._create_context(sid)
+        record.apply_to(context)
+        self.add(context, persist=False)
+        return context
+
+    def add(self, context: "ConversationContext", *, persist: bool = True):
+        with self._lock:
+            self._contexts[context.sid] = context
+            self._contexts.move_to_end(context.sid)
+            evicted = []
+            while len(self._contexts) > self._capacity:
+                evicted.append(self._contexts.popitem(last=False)[1])
+
+        if persist:
+            self.save(context)
+        for evicted_context in evicted:
+            self.save(evicted_context)
+
+    def save(self, context: "ConversationContext"):
+        self._db.execute(
+            "INSERT OR REPLACE INTO conversation_contexts VALUES (?, ?, ?, ?, ?, ?)",
+            ContextRecord.from_context(context).to_row()
+        )
+
+    def forget(self, sid: str) -> "ConversationContext | None":
+        """Drop the live context and return it, its record (saved after every turn) stays on disk"""
+        with self._lock:
+            return self._contexts.pop(sid, None)
+
+    def load_record(self, sid: str) -> ContextRecord | None:
+        rows = self._db.query("SELECT * FROM conversation_contexts WHERE sid = ?", (sid,))
+        return ContextRecord.from_row(rows[0]) if rows else None
+
+    def __len__(self):
+        return len(self._contexts)
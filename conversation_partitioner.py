@@ -0,0 +1,231 @@
+import bisect
+import hashlib
+import threading
+import time
+
+from sqlite_connection import SharedConnection
+
+
+class ConsistentHashRing:
+    VIRTUAL_NODES = 64
+
+    def __init__(self, nodes: list[str], virtual_nodes: int = VIRTUAL_NODES):
+        self.nodes = frozenset(nodes)
+        self._ring: list[tuple[int, str]] = sorted(
+            (self._hash(f"{node}#{i}"), node) for node in nodes for i in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in self._ring]
+
+    def node_for(self, key: str) -> str | None:
+        if not self._ring:
+            return None
+        position = bisect.bisect(self._hashes, self._hash(key)) % len(self._ring)
+        return self._ring[position][1]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class LeaseStore:
+    """
+    Shared SQLite file with worker heartbeats, conversation leases and a bounded log of
+    processed message SIDs. Every worker process opens the same file.
+    """
+    PROCESSED_LOG_SIZE = 10_000
+
+    def __init__(self, path: str, processed_log_size: int = PROCESSED_LOG_SIZE):
+        self._processed_log_size = processed_log_size
+        self._db = SharedConnection(path, """
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                heartbeat_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS leases (
+                conversation_sid TEXT PRIMARY KEY,
+                worker_id TEXT,
+                expires_at REAL NOT NULL DEFAULT 0,
+                last_message_index INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS processed_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_sid TEXT NOT NULL UNIQUE
+            );
+        """)
+
+    def heartbeat(self, worker_id: str):
+        self._db.execute(
+            "INSERT INTO workers (worker_id, heartbeat_at) VALUES (?, ?) "
+            "ON CONFLICT(worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+            (worker_id, time.time())
+        )
+
+    def live_workers(self, ttl: float) -> list[str]:
+        rows = self._db.query(
+            "SELECT worker_id FROM workers WHERE heartbeat_at >= ?", (time.time() - ttl,)
+        )
+        return [worker_id for worker_id, in rows]
+
+    def remove_worker(self, worker_id: str):
+        self._db.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+        self._db.execute(
+            "UPDATE leases SET worker_id = NULL, expires_at = 0 WHERE worker_id = ?", (worker_id,)
+        )
+
+    def acquire(self, conversation_sid: str, worker_id: str, ttl: float) -> bool:
+        """Take or renew the lease unless another worker holds a valid one"""
+        now = time.time()
+        cursor = self._db.execute(
+            "INSERT INTO leases (conversation_sid, worker_id, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(conversation_sid) DO UPDATE "
+            "SET worker_id = excluded.worker_id, expires_at = excluded.expires_at "
+            "WHERE leases.worker_id = excluded.worker_id OR leases.expires_at < ?",
+            (conversation_sid, worker_id, now + ttl, now)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, conversation_sid: str, worker_id: str):
+        self._db.execute(
+            "UPDATE leases SET worker_id = NULL, expires_at = 0 "
+            "WHERE conversation_sid = ? AND worker_id = ?",
+            (conversation_sid, worker_id)
+        )
+
+    def last_message_index(self, conversation_sid: str) -> int | None:
+        rows = self._db.query(
+            "SELECT last_message_index FROM leases WHERE conversation_sid = ?", (conversation_sid,)
+        )
+        return rows[0][0] if rows else None
+
+    def record_progress(self, conversation_sid: str, index: int):
+        self._db.execute(
+            "UPDATE leases SET last_message_index = MAX(COALESCE(last_message_index, -1), ?) "
+            "WHERE conversation_sid = ?",
+            (index, conversation_sid)
+        )
+
+    def claim_message(self, message_sid: str) -> bool:
+        """False if any worker already processed this message"""
+        cursor = self._db.execute(
+            "INSERT OR IGNORE INTO processed_messages (message_sid) VALUES (?)", (message_sid,)
+        )
+        if cursor.rowcount != 1:
+            return False
+
+        self._db.execute(
+            "DELETE FROM processed_messages WHERE id <= ?",
+            (cursor.lastrowid - self._processed_log_size,)
+        )
+        return True
+
+
+class ConversationPartitioner:
+    """
+    Decides which conversations this worker polls. Conversations are spread over the live
+    workers by consistent hashing, and a lease in the shared store guarantees a single owner
+    while workers join or leave. Heartbeats and lease renewals run on their own thread, a
+    handler blocking the poll loop must not cost us our conversations.
+    """
+    LEASE_TTL = 30
+    HEARTBEAT_INTERVAL = 10
+
+    def __init__(self, store: LeaseStore, worker_id: str, *, lease_ttl: float = LEASE_TTL,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL):
+        self._store = store
+        self._worker_id = worker_id
+        self._lease_ttl = lease_ttl
+        self._heartbeat_interval = heartbeat_interval
+        self._ring = ConsistentHashRing([worker_id])
+        self._lease_expiry: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._last_refresh = 0.0
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._heartbeat()
+        self._thread = threading.Thread(target=self._run, name="partition-heartbeat",
+                                        daemon=True)
+        self._thread.start()
+
+    def refresh(self):
+        """Rebalance when the set of live workers changed"""
+        now = time.time()
+        if now - self._last_refresh < self._heartbeat_interval:
+            return
+
+        if not self._thread:
+            # Not started, e.g. in scripts: heartbeat from the caller's loop
+            self._store.heartbeat(self._worker_id)
+        self._last_refresh = now
+        workers = self._store.live_workers(ttl=self._lease_ttl)
+
+        if frozenset(workers) != self._ring.nodes:
+            print(f"Rebalancing conversations over workers {sorted(workers)}")
+            self._ring = ConsistentHashRing(workers)
+            with self._lock:
+                released = [sid for sid in self._lease_expiry
+                            if self._ring.node_for(sid) != self._worker_id]
+            for sid in released:
+                self.release(sid)
+
+    def owns(self, conversation_sid: str) -> bool:
+        if self._ring.node_for(conversation_sid) != self._worker_id:
+            return False
+
+        now = time.time()
+        with self._lock:
+            # Only renew once half of the lease is used up
+            if self._lease_expiry.get(conversation_sid, 0) - now > self._lease_ttl / 2:
+                return True
+            return self._renew(conversation_sid, now)
+
+    def release(self, conversation_sid: str):
+        with self._lock:
+            self._lease_expiry.pop(conversation_sid, None)
+        self._store.release(conversation_sid, self._worker_id)
+
+    def resume_index(self, conversation_sid: str) -> int | None:
+        return self._store.last_message_index(conversation_sid)
+
+    def record_progress(self, conversation_sid: str, index: int):
+        self._store.record_progress(conversation_sid, index)
+
+    def claim_message(self, message_sid: str) -> bool:
+        return self._store.claim_message(message_sid)
+
+    def leave(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self._lease_expiry.clear()
+        self._store.remove_worker(self._worker_id)
+
+    def _renew(self, conversation_sid: str, now: float) -> bool:
+        # Called with the lock held, a lease released meanwhile must not come back
+        if self._store.acquire(conversation_sid, self._worker_id, self._lease_ttl):
+            self._lease_expiry[conversation_sid] = now + self._lease_ttl
+            return True
+
+        self._lease_expiry.pop(conversation_sid, None)
+        return False
+
+    def _heartbeat(self):
+        """Keep this worker alive and renew every lease it holds"""
+        self._store.heartbeat(self._worker_id)
+        now = time.time()
+        with self._lock:
+            for sid in list(self._lease_expiry):
+                self._renew(sid, now)
+
+    def _run(self):
+        while not self._stopped.wait(self._heartbeat_interval):
+            try:
+                self._heartbeat()
+            except Exception as e:
+                print(f"Error sending partition heartbeat: {e}")
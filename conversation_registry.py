@@ -0,0 +1,93 @@
+import threading
+import time
+from collections.abc import Callable, Iterable
+from datetime import datetime, timedelta, timezone
+from twilio.rest.conversations.v1.service.conversation import ConversationInstance
+
+from metrics import timed
+
+
+class ConversationRegistry:
+    """
+    Local set of known, not closed conversation SIDs. Kept up to date by webhook events and a
+    slow background refresh that only lists conversations created since the last refresh.
+    A full listing now and then notices conversations that were closed.
+    """
+    REFRESH_INTERVAL = 60
+    FULL_REFRESH_INTERVAL = 3600
+
+    def __init__(self, list_conversations: Callable[..., Iterable[ConversationInstance]], *,
+                 refresh_interval: float = REFRESH_INTERVAL,
+                 full_refresh_interval: float = FULL_REFRESH_INTERVAL):
+        self._list_conversations = list_conversations
+        self._refresh_interval = refresh_interval
+        self._full_refresh_interval = full_refresh_interval
+        self._sids: set[str] = set()
+        self._lock = threading.Lock()
+        self._last_refresh: datetime | None = None
+        self._last_full_refresh = 0.0
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def sids(self) -> list[str]:
+        with self._lock:
+            return list(self._sids)
+
+    def add(self, sid: str):
+        with self._lock:
+            self._sids.add(sid)
+
+    def remove(self, sid: str):
+        with self._lock:
+            self._sids.discard(sid)
+
+    @timed("twilio.list_conversations")
+    def refresh(self):
+        now = datetime.now(tz=timezone.utc)
+        full_refresh = (self._last_refresh is None
+                        or time.monotonic() - self._last_full_refresh >= self._full_refresh_interval)
+
+        if full_refresh:
+            conversations = self._list_conversations()
+        else:
+            # The filter works on whole days, overlapping by one day is harmless
+            start_date = (self._last_refresh - timedelta(days=1)).strftime("%Y-%m-%d")
+            conversations = self._list_conversations(start_date=start_date)
+
+        active_sids = set()
+        closed_sids = set()
+        for conversation in conversations:
+            if conversation.state == "closed":
+                closed_sids.add(conversation.sid)
+            else:
+                active_sids.add(conversation.sid)
+
+        with self._lock:
+            if full_refresh:
+                self._sids = active_sids
+            else:
+                self._sids |= active_sids
+                self._sids -= closed_sids
+
+        if full_refresh:
+            self._last_full_refresh = time.monotonic()
+        self._last_refresh = now
+
+    def start(self):
+        """Refresh in the background, call refresh() once before to have a complete view"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="conversation-registry",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self._refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing conversations: {e}")
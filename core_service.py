@@ -2,6 +2,7 @@ from game_service import GameService
 from twilio_client import ConversationStatus, ConversationContext
 from user_service import UserService
 import user_messages
+from metrics import timed
 
 
 class CoreService:
@@ -9,6 +10,7 @@ class CoreService:
         self._user_service = user_service
         self._game_service = game_service
 
+    @timed("core.handle_message")
     def handle_message(self, context: ConversationContext):
         if context.is_authenticating():
             self._user_service.authenticate_user(context, self.handle_message)
@@ -20,6 +22,7 @@ class CoreService:
             context.send_message(user_messages.UNKNOWN)
             print(f"Nachricht erhalten: {context.message}")
 
+    @timed("core.handle_command")
     def handle_command(self, context: ConversationContext, command: str):
         match command:
             case "start":
@@ -35,6 +38,7 @@ class CoreService:
                 if context.is_playing():
                     context.transition_status(to=ConversationStatus.INACTIVE)
                     context.current_exercise = None
+                    self._game_service.end_game(context)
                     context.send_message(user_messages.STOP_MESSAGE)
                     print("Lernsession beendet.")
                 else:
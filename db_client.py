@@ -1,12 +1,49 @@
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
+from urllib3.util.retry import Retry
 from constants import LearningLevel, LearningLanguage
+from metrics import timed, EVENTS
+from ttl_cache import TTLCache, MISSING
 
 
 class DBClient:
-    def __init__(self, base_url):
+    POOL_SIZE = 10
+    CONNECT_TIMEOUT = 3.05
+    READ_TIMEOUT = 10
+    MAX_RETRIES = 3
+    RETRY_BACKOFF = 0.3
+    USER_CACHE_SIZE = 10_000
+    USER_CACHE_TTL = 300
+    # Unknown users are onboarding right now, don't remember that for long
+    USER_NOT_FOUND_TTL = 10
+    # Responses with an ETag are kept this long to revalidate them with If-None-Match
+    VALIDATOR_TTL = 3600
+
+    def __init__(self, base_url, *, pool_size: int = POOL_SIZE,
+                 connect_timeout: float = CONNECT_TIMEOUT, read_timeout: float = READ_TIMEOUT,
+                 max_retries: int = MAX_RETRIES, user_cache_size: int = USER_CACHE_SIZE,
+                 user_cache_ttl: float = USER_CACHE_TTL):
         self._base_url = f"http://{base_url}"
+        self._user_cache = TTLCache(maxsize=user_cache_size, ttl=user_cache_ttl)
+        # url -> (ETag, decoded body)
+        self._validators = TTLCache(maxsize=user_cache_size, ttl=DBClient.VALIDATOR_TTL)
+        self._timeout = (connect_timeout, read_timeout)
+        # Connection errors are retried for every method, read errors and 5xx only for
+        # idempotent ones, so a POST is never applied twice
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=DBClient.RETRY_BACKOFF,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
 
+    @timed("db.create_user")
     def create_user(
             self,
             sid: str,
@@ -23,24 +60,36 @@ class DBClient:
                 "from_code2": from_lang.code(),
                 "to_code2": to_lang.code(),
             }
-            response = requests.post(url, json=payload)
+            response = self._session.post(url, json=payload, timeout=self._timeout)
             response.raise_for_status()
         except RequestException as e:
             #print(response.json())
             print(f"Error creating user: {e}")
             raise e
+        finally:
+            self._user_cache.invalidate(sid)
 
+    @timed("db.get_user")
     def get_user(self, sid) -> dict:
+        cached_user = self._user_cache.get(sid)
+        if cached_user is not MISSING:
+            EVENTS.inc(event="user_cache_hit")
+            return cached_user
+
         try:
             url = f"{self._base_url}/users/{sid}"
-            response = requests.get(url)
-            if response.status_code == 200:
-                return response.json()
+            response, user = self._get_json(url)
+            if user is not None:
+                self._user_cache.set(sid, user)
+                return user
+            if response.status_code == 404:
+                self._user_cache.set(sid, None, ttl=DBClient.USER_NOT_FOUND_TTL)
             return None
         except RequestException as e:
             print(f"Error getting user {sid}: {e}")
             raise e
 
+    @timed("db.create_word")
     def create_word(self, from_word: str, to_word: str, lang: LearningLanguage,
                     level: LearningLevel) -> None:
         try:
@@ -54,13 +103,30 @@ class DBClient:
                 "ru": None,
             }
             payload[lang.code().lower()] = to_word
-            response = requests.post(url, json=payload)
+            response = self._session.post(url, json=payload, timeout=self._timeout)
             response.raise_for_status()
         except RequestException as e:
             #print(response.json())
             print(f"Error creating word: {e}")
             raise e
 
+    @timed("db.create_words")
+    def create_words(self, words: dict[str, str], lang: LearningLanguage,
+                     level: LearningLevel) -> None:
+        """Create or update several words (German word -> translation) with one request"""
+        try:
+            url = f"{self._base_url}/words/bulk"
+            code = lang.code().lower()
+            payload = {
+                "level_id": level.__repr__().lower(),
+                "words": [{"de": from_word, code: to_word} for from_word, to_word in words.items()],
+            }
+            response = self._session.post(url, json=payload, timeout=self._timeout)
+            response.raise_for_status()
+        except RequestException as e:
+            print(f"Error creating words: {e}")
+            raise e
+
     #def update_word(self, from_word: str, new_word: str, level: LearningLevel) -> None:
     #    try:
     #        url = f"{self._base_url}/words/update/{from_word}"
@@ -71,33 +137,97 @@ class DBClient:
     #        raise e
 
     def has_word(self, lang: LearningLanguage, level: LearningLevel) -> bool:
+        return self.word_count(lang, level) > 0
+
+    @timed("db.word_count")
+    def word_count(self, lang: LearningLanguage, level: LearningLevel) -> int:
+        """Number of words of the level with a translation into lang"""
         try:
-           url = f"{self._base_url}/words/translation/{lang.code().lower()}/{level.__repr__().lower()}"
-           response = requests.get(url)
-           response.raise_for_status()
-           return response.json().get("has_translation")
+            url = f"{self._base_url}/words/coverage/{lang.code().lower()}/{level.__repr__().lower()}"
+            response, coverage = self._get_json(url)
+            response.raise_for_status()
+            return coverage.get("count")
         except RequestException as e:
-            if response.status_code == 404:
-                return False
-            print(f"Error checking translation for {lang.code()}': {e}")
+            print(f"Error getting word count for {lang.code()}': {e}")
             raise e
 
-    def get_words(self, lang: LearningLanguage, level: LearningLevel) -> list[dict]:
+    @timed("db.known_words")
+    def known_words(self, lang: LearningLanguage, level: LearningLevel) -> list[str]:
+        """German words that can't be added to the vocabulary of lang and level anymore,
+        the newest last"""
+        try:
+            url = f"{self._base_url}/words/known/{lang.code().lower()}/{level.__repr__().lower()}"
+            response, words = self._get_json(url)
+            response.raise_for_status()
+            return words
+        except RequestException as e:
+            print(f"Error getting known words for {lang.code()}: {e}")
+            raise e
+
+    @timed("db.get_words")
+    def get_words(self, lang: LearningLanguage, level: LearningLevel,
+                  count: int = 1) -> list[dict]:
         try:
             url = f"{self._base_url}/words/random/{lang.code().lower()}"
-            response = requests.get(url)
+            params = {"level": level.__repr__().lower(), "count": count}
+            response = self._session.get(url, params=params, timeout=self._timeout)
+            if response.status_code == 404:
+                # No words for this language and level (yet)
+                return []
             response.raise_for_status()
-            return [response.json()]
+            return response.json()
         except RequestException as e:
-            print(response.json())
+            if e.response is not None:
+                print(e.response.text)
             print(f"Error getting random word in '{lang.code()}': {e}")
             raise e
 
+    @timed("db.increase_progress")
     def increase_progress(self, sid: str, word_id: str) -> None:
         try:
             url = f"{self._base_url}/words/update_correct_count/{sid}/{word_id}"
-            response = requests.post(url)
+            response = self._session.post(url, timeout=self._timeout)
             response.raise_for_status()
         except RequestException as e:
             print(f"Error increasing progress for user '{sid}' and word '{word_id}': {e}")
             raise e
+
+    @timed("db.increase_progress_batch")
+    def increase_progress_batch(self, progress: dict[tuple[str, int], int],
+                                batch_id: str | None = None) -> None:
+        """
+        Add correct answers, (user, word id) -> count, with one request. The API applies a
+        batch id only once, a batch sent again after a timeout is not counted twice.
+        """
+        try:
+            url = f"{self._base_url}/words/progress/batch"
+            payload = {"progress": [
+                {"user_id": sid, "word_id": word_id, "count": count}
+                for (sid, word_id), count in progress.items()
+            ]}
+            if batch_id is not None:
+                payload["batch_id"] = batch_id
+            response = self._session.post(url, json=payload, timeout=self._timeout)
+            response.raise_for_status()
+        except RequestException as e:
+            print(f"Error increasing progress of {len(progress)} words: {e}")
+            raise e
+
+    def _get_json(self, url: str) -> tuple[requests.Response, dict | list | None]:
+        """GET that revalidates an earlier response by its ETag, the body is None unless 200/304"""
+        validator = self._validators.get(url)
+        headers = {"If-None-Match": validator[0]} if validator is not MISSING else None
+        response = self._session.get(url, headers=headers, timeout=self._timeout)
+
+        if response.status_code == 304 and validator is not MISSING:
+            EVENTS.inc(event="db_not_modified")
+            return response, validator[1]
+        if response.status_code != 200:
+            self._validators.invalidate(url)
+            return response, None
+
+        body = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            self._validators.set(url, (etag, body))
+        return response, body
@@ -1,43 +1,111 @@
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote_plus
 from dotenv import load_dotenv
 import os
 
 from constants import LearningLanguage
+from metrics import timed
+from translation_memory import TranslationMemory, normalize
 
 
 class DeepLClient:
-    def __init__(self):
+    API_URL = "https://api-free.deepl.com/v2/translate"
+    # DeepL accepts up to 50 texts and 128 KiB per request
+    MAX_TEXTS_PER_REQUEST = 50
+    MAX_REQUEST_BYTES = 120 * 1024
+    MAX_CONCURRENCY = 4
+    TIMEOUT = (3.05, 30)
+
+    def __init__(self, *, api_url: str | None = None, max_concurrency: int = MAX_CONCURRENCY,
+                 memory: TranslationMemory | None = None):
         load_dotenv()
         api_key = os.getenv("DEEPL_API_KEY")
         if not api_key:
             raise ValueError("DEEPL_API_KEY not found in .env file.")
         self.api_key = api_key
-        self.api_url = "https://api-free.deepl.com/v2/translate"
+        self.api_url = api_url or os.getenv("DEEPL_API_URL", DeepLClient.API_URL)
+        self.memory = memory
+        self._session = requests.Session()
+        self._session.headers["Authorization"] = f"DeepL-Auth-Key {api_key}"
+        # Chunks of one large batch are sent in parallel, at most max_concurrency at a time
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency,
+                                            thread_name_prefix="deepl")
 
     def translate_text(self, text: str, *, target_lang: LearningLanguage,
                        source_lang: LearningLanguage = LearningLanguage.DE) -> str:
         """Translate a single string"""
-        response = requests.post(
+        return self.translate_texts([text], target_lang=target_lang, source_lang=source_lang)[0]
+
+    def translate_texts(self, texts: list[str], *, target_lang: LearningLanguage,
+                        source_lang: LearningLanguage = LearningLanguage.DE) -> list[str]:
+        """Translate many strings with as few requests as possible, keeping their order"""
+        if self.memory is None:
+            return self._translate_all(texts, target_lang, source_lang)
+
+        # Only texts the translation memory doesn't know yet are sent, each of them once
+        known = self.memory.get_many(texts, source_lang=source_lang, target_lang=target_lang)
+        unknown = [text for text in dict.fromkeys(map(normalize, texts)) if text not in known]
+        if unknown:
+            translations = dict(zip(unknown, self._translate_all(unknown, target_lang, source_lang)))
+            self.memory.put_many(translations, source_lang=source_lang, target_lang=target_lang)
+            known |= translations
+        return [known[normalize(text)] for text in texts]
+
+    def _translate_all(self, texts: list[str], target_lang: LearningLanguage,
+                       source_lang: LearningLanguage) -> list[str]:
+        chunks = list(self._chunks(texts))
+        if len(chunks) <= 1:
+            return [translation for chunk in chunks
+                    for translation in self._translate_chunk(chunk, target_lang, source_lang)]
+
+        results = self._executor.map(
+            lambda chunk: self._translate_chunk(chunk, target_lang, source_lang), chunks
+        )
+        return [translation for chunk_result in results for translation in chunk_result]
+
+    def translate_dict(self, data: dict, *, target_lang: LearningLanguage,
+                       source_lang: LearningLanguage = LearningLanguage.DE) -> dict:
+        """Translate all values in a dictionary while preserving keys"""
+        keys = list(data)
+        translations = self.translate_texts(
+            [data[key] for key in keys], target_lang=target_lang, source_lang=source_lang
+        )
+        return dict(zip(keys, translations))
+
+    @timed("deepl.translate")
+    def _translate_chunk(self, texts: list[str], target_lang: LearningLanguage,
+                         source_lang: LearningLanguage) -> list[str]:
+        response = self._session.post(
             self.api_url,
             data={
-                "auth_key": self.api_key,
-                "text": text,
+                "text": texts,
                 "source_lang": source_lang.code(),
                 "target_lang": target_lang.code()
-            }
+            },
+            timeout=DeepLClient.TIMEOUT
         )
         response.raise_for_status()
-        return response.json()["translations"][0]["text"]
+        translations = [translation["text"] for translation in response.json()["translations"]]
+        if len(translations) != len(texts):
+            raise ValueError(f"DeepL returned {len(translations)} translations for {len(texts)} texts")
+        return translations
 
-    def translate_dict(self, data: dict, *, target_lang: LearningLanguage,
-                       source_lang: LearningLanguage = LearningLanguage.DE) -> dict:
-        """Translate all values in a dictionary while preserving keys"""
-        translated = {}
-        for key, value in data.items():
-            translated[key] = self.translate_text(
-                value, target_lang=target_lang, source_lang=source_lang
-            )
-        return translated
+    @staticmethod
+    def _chunks(texts: list[str]):
+        chunk = []
+        size = 0
+        for text in texts:
+            text_size = len(quote_plus(text)) + len("&text=")
+            if chunk and (len(chunk) == DeepLClient.MAX_TEXTS_PER_REQUEST
+                          or size + text_size > DeepLClient.MAX_REQUEST_BYTES):
+                yield chunk
+                chunk = []
+                size = 0
+            chunk.append(text)
+            size += text_size
+        if chunk:
+            yield chunk
 
 
 def main():
@@ -49,7 +117,7 @@ def main():
     client = DeepLClient()
 
     # Translate the dictionary
-    translated_dict = client.translate_dict(word_dict)
+    translated_dict = client.translate_dict(word_dict, target_lang=LearningLanguage.EN)
 
     # Print the translated result
     print(translated_dict)
@@ -0,0 +1,84 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class _FakeDeepLHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != "/v2/translate":
+            self.send_error(404)
+            return
+        if not self.headers.get("Authorization", "").startswith("DeepL-Auth-Key "):
+            self.send_error(403)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        params = parse_qs(self.rfile.read(length).decode())
+        texts = params.get("text", [])
+        target_lang = params.get("target_lang", ["EN"])[0]
+        if len(texts) > self.server.max_texts:
+            self.send_error(413)
+            return
+
+        self.server.record(texts)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        body = json.dumps({"translations": [
+            {"detected_source_language": params.get("source_lang", ["DE"])[0],
+             "text": f"{text} [{target_lang}]"}
+            for text in texts
+        ]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeDeepLServer(ThreadingHTTPServer):
+    """
+    Stand-in for the DeepL API that "translates" by appending the target language.
+    Point DEEPL_API_URL at it to develop and test without paying for characters.
+    """
+
+    def __init__(self, port: int = 0, *, latency: float = 0, max_texts: int = 50):
+        super().__init__(("127.0.0.1", port), _FakeDeepLHandler)
+        self.latency = latency
+        self.max_texts = max_texts
+        self.requests: list[list[str]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v2/translate"
+
+    def record(self, texts: list[str]):
+        with self._lock:
+            self.requests.append(texts)
+
+    def start(self) -> "FakeDeepLServer":
+        threading.Thread(target=self.serve_forever, name="fake-deepl", daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake DeepL API locally")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds added to every request")
+    args = parser.parse_args()
+
+    server = FakeDeepLServer(args.port, latency=args.latency)
+    print(f"Fake DeepL API on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
-import random
+import user_messages
 from db_client import DBClient
+from progress_buffer import ProgressBuffer
 from twilio_client import ConversationContext
+from word_deck import WordDeckPool
 
 
 class GameService:
-    def __init__(self, db: DBClient):
+    def __init__(self, db: DBClient, decks: WordDeckPool | None = None,
+                 progress: ProgressBuffer | None = None):
         self._db = db
+        self._decks = decks or WordDeckPool(db)
+        self._progress = progress or ProgressBuffer(db)
 
     def play_game(self, context: ConversationContext):
         sid = context.sid
@@ -16,15 +21,28 @@ class GameService:
             to_word = current_word.get("translation")
 
             if self.check_answer(context.message, to_word):
-                self._db.increase_progress(sid, wid)
+                self._progress.add(sid, wid)
                 context.send_message("Correct")
             else:
                 context.send_message(f"Incorrect. The correct answer is {to_word}")
 
-        new_word = self.get_random_word(context)
+        try:
+            new_word = self.get_random_word(context)
+        except LookupError:
+            # The vocabulary of a new language and level is still being generated
+            context.send_message(user_messages.WORDS_NOT_READY)
+            return
+
         context.current_exercise = new_word
         context.send_message(f"How to say {new_word.get('de')} in {context.learning_lang}")
 
+    def end_game(self, context: ConversationContext):
+        try:
+            self._progress.flush(context.sid)
+        except Exception as e:
+            # Stays buffered, the next periodic flush tries again
+            print(f"Error saving progress of {context.sid}: {e}")
+
     def check_answer(self, user_answer: str, correct_answer: str) -> bool:
         user_answer = user_answer.strip().lower()
         correct_answer = correct_answer.strip().lower()
@@ -35,5 +53,4 @@ class GameService:
             return False
 
     def get_random_word(self, context: ConversationContext) -> dict:
-        words = self._db.get_words(context.learning_lang, context.learning_level)
-        return random.choice(words)
+        return self._decks.next_word(context.learning_lang, context.learning_level)
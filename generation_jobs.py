@@ -0,0 +1,120 @@
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import LearningLanguage, LearningLevel
+from metrics import EVENTS
+
+
+class GenerationJob:
+    """Vocabulary generation for one language and level, shared by everyone waiting for it"""
+
+    def __init__(self, lang: LearningLanguage, level: LearningLevel):
+        self.lang = lang
+        self.level = level
+        self.target = 0
+        self.stored = 0
+        self.error: Exception | None = None
+        self._lock = threading.Lock()
+        self._first_words = threading.Event()
+        self._done = threading.Event()
+        self._first_words_callbacks: list[Callable[["GenerationJob"], None]] = []
+
+    def set_target(self, target: int):
+        self.target = target
+
+    def report(self, stored: int):
+        """Called by the generator after each batch of words is in the database"""
+        with self._lock:
+            self.stored += stored
+        if stored:
+            self._set_first_words()
+
+    def wait_for_first_words(self, timeout: float | None = None) -> bool:
+        """True once words are available or the job ended, check `error` afterwards"""
+        return self._first_words.wait(timeout)
+
+    def on_first_words(self, callback: Callable[["GenerationJob"], None]):
+        """Call back (on the generating thread) once words are available or the job ended,
+        right away if that already happened"""
+        with self._lock:
+            if not self._first_words.is_set():
+                self._first_words_callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._done.wait(timeout)
+
+    def is_done(self) -> bool:
+        return self._done.is_set()
+
+    def finish(self, error: Exception | None = None):
+        self.error = error
+        self._set_first_words()
+        self._done.set()
+
+    def _set_first_words(self):
+        with self._lock:
+            if self._first_words.is_set():
+                return
+            self._first_words.set()
+            callbacks, self._first_words_callbacks = self._first_words_callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"Error in first words callback of {self!r}: {e}")
+
+    def __repr__(self):
+        return f"GenerationJob({self.lang!r}, {self.level!r}, {self.stored}/{self.target})"
+
+
+class GenerationJobQueue:
+    """
+    Runs vocabulary generation in the background. Requests for a language and level that is
+    already being generated join the running job instead of starting a second one.
+    """
+    WORKERS = 2
+
+    def __init__(self, generate: Callable[[GenerationJob], None], *, workers: int = WORKERS):
+        self._generate = generate
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix="generation-job")
+        self._jobs: dict[tuple[LearningLanguage, LearningLevel], GenerationJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, lang: LearningLanguage, level: LearningLevel) -> GenerationJob:
+        with self._lock:
+            job = self._jobs.get((lang, level))
+            if job:
+                EVENTS.inc(event="generation_job_joined")
+                return job
+
+            job = self._jobs[(lang, level)] = GenerationJob(lang, level)
+
+        EVENTS.inc(event="generation_job_started")
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, lang: LearningLanguage, level: LearningLevel) -> GenerationJob | None:
+        with self._lock:
+            return self._jobs.get((lang, level))
+
+    def jobs(self) -> list[GenerationJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _run(self, job: GenerationJob):
+        error = None
+        try:
+            self._generate(job)
+        except Exception as e:
+            print(f"Error generating words for {job.lang} ({job.level}): {e}")
+            error = e
+        finally:
+            # Later requests start a new job, which tops up from the then current coverage
+            with self._lock:
+                self._jobs.pop((job.lang, job.level), None)
+            job.finish(error)
@@ -1,15 +1,69 @@
 import openai
 import ast
+import json
+from collections.abc import Iterator
 from dotenv import load_dotenv
 import os
 
 from constants import LearningLanguage, LearningLevel
+from metrics import timed, STAGE_DURATION, STAGE_ERRORS, EVENTS
+from ttl_cache import TTLCache, MISSING
+
+
+class JsonWordStreamParser:
+    """
+    Incremental parser for a streamed JSON reply: every string that is an element of an array,
+    e.g. of {"words": ["Haus", "Baum"]}, is returned as soon as its closing quote arrives.
+    Words before a broken or missing tail are not lost.
+    """
+
+    def __init__(self):
+        self._containers: list[str] = []
+        self._string: list[str] | None = None
+        self._escaped = False
+
+    def feed(self, chunk: str) -> list[str]:
+        words = []
+        for char in chunk:
+            if self._string is not None:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    word = self._close_string()
+                    if word is not None:
+                        words.append(word)
+                    continue
+                self._string.append(char)
+            elif char == '"':
+                self._string = []
+            elif char in "[{":
+                self._containers.append(char)
+            elif char in "]}" and self._containers:
+                self._containers.pop()
+        return words
+
+    def _close_string(self) -> str | None:
+        raw = "".join(self._string)
+        self._string = None
+        if not self._containers or self._containers[-1] != "[":
+            return None
+        try:
+            return json.loads(f'"{raw}"')
+        except ValueError:
+            return None
 
 
 class GPT4oMiniClient:
     """
     constructor to create an object from this class
     """
+    # Complete replies by prompt, the same prompt is not paid for twice
+    RESPONSE_CACHE_SIZE = 256
+    RESPONSE_CACHE_TTL = 24 * 3600
+    # Words the LLM is told to leave out, the prompt stays small
+    MAX_EXCLUDED_WORDS = 200
 
     def __init__(self):
         load_dotenv()
@@ -20,29 +74,92 @@ class GPT4oMiniClient:
 
         # Use the new OpenAI client
         self.client = openai.OpenAI(api_key=api_key)
+        self._responses = TTLCache(maxsize=GPT4oMiniClient.RESPONSE_CACHE_SIZE,
+                                   ttl=GPT4oMiniClient.RESPONSE_CACHE_TTL)
 
+    @timed("openai.chat")
     def chat(self, language_native: LearningLanguage, language_to_learn: LearningLanguage,
-             language_level: LearningLevel = LearningLevel.EASY, number_of_words=50):
+             language_level: LearningLevel = LearningLevel.EASY, number_of_words=50,
+             exclude: list[str] | None = None, use_cache: bool = True):
         """
         module to create a list of 50 words to learn in a certain language
         """
+        prompt = (
+            "Please return me a dictionary with int as primary key for each word of a "
+            f"list of {number_of_words}. Assume the person is speaking"
+            f" {language_native}, and "
+            f"wants to learn {language_to_learn} and has the following language "
+            f"level: {language_level}."
+            " Please return the list in his native language without translation. Please "
+            "only return the dictionary starting your response with { and ending with }."
+            "PLEASE!."
+            + self._exclusion(exclude)
+        )
+        cached = self._responses.get(prompt) if use_cache else MISSING
+        if cached is not MISSING:
+            EVENTS.inc(event="llm_cache_hit")
+            return cached
+
         try:
             response = self.client.chat.completions.create(
                 model="gpt-4o-mini",
-                messages=[{"role": "user", "content":
-                    "Please return me a dictionary with int as primary key for each word of a "
-                    f"list of {number_of_words}. Assume the person is speaking"
-                    f" {language_native}, and "
-                    f"wants to learn {language_to_learn} and has the following language "
-                    f"level: {language_level}."
-                    " Please return the list in his native language without translation. Please "
-                    "only return the dictionary starting your response with { and ending with }."
-                    "PLEASE!."}]
+                messages=[{"role": "user", "content": prompt}]
             )
-            return response.choices[0].message.content
+            answer = response.choices[0].message.content
+            self._responses.set(prompt, answer)
+            return answer
         except Exception as e:
             return f"Error: {str(e)}"
 
+    def stream_words(self, language_native: LearningLanguage,
+                     language_to_learn: LearningLanguage,
+                     language_level: LearningLevel = LearningLevel.EASY,
+                     number_of_words=50, exclude: list[str] | None = None,
+                     use_cache: bool = True) -> Iterator[str]:
+        """
+        Like chat(), but asks for JSON and yields every word as soon as it was generated
+        """
+        prompt = (
+            f"Return a JSON object {{\"words\": [...]}} with a list of "
+            f"{number_of_words} different words. Assume the person is speaking "
+            f"{language_native}, and wants to learn {language_to_learn} and has the "
+            f"following language level: {language_level}. The words must be in "
+            "his native language without translation."
+            + self._exclusion(exclude)
+        )
+        parser = JsonWordStreamParser()
+        cached = self._responses.get(prompt) if use_cache else MISSING
+        if cached is not MISSING:
+            EVENTS.inc(event="llm_cache_hit")
+            yield from parser.feed(cached)
+            return
+
+        with STAGE_DURATION.time(stage="openai.stream"):
+            try:
+                stream = self.client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    response_format={"type": "json_object"},
+                    stream=True,
+                    messages=[{"role": "user", "content": prompt}]
+                )
+                reply = []
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        reply.append(chunk.choices[0].delta.content)
+                        yield from parser.feed(chunk.choices[0].delta.content)
+            except Exception:
+                STAGE_ERRORS.inc(stage="openai.stream")
+                raise
+        # Only complete replies are cached
+        self._responses.set(prompt, "".join(reply))
+
+    @staticmethod
+    def _exclusion(exclude: list[str] | None) -> str:
+        if not exclude:
+            return ""
+        words = exclude[-GPT4oMiniClient.MAX_EXCLUDED_WORDS:]
+        return f" Do not use any of these words: {', '.join(words)}."
+
     def string_to_dict(self, dict_string: str) -> dict:
         """
         method to transform the response string to a dictionary
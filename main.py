@@ -1,13 +1,26 @@
+import asyncio
 import os
+import threading
+import uvicorn
 from dotenv import load_dotenv
 
 from db_client import DBClient
 from deepl_client import DeepLClient
+from translation_memory import TranslationMemory
 from gpt4o_mini_client import GPT4oMiniClient
 from user_service import UserService
 from game_service import GameService
+from word_deck import WordDeckPool
+from progress_buffer import ProgressBuffer
 from core_service import CoreService
 from twilio_client import TwilioClient
+from offline_twilio import OfflineTwilio
+from async_twilio_client import AsyncTwilioClient
+from conversation_partitioner import ConversationPartitioner, LeaseStore
+from outbound_dispatcher import OutboundDispatcher
+from poll_scheduler import PollScheduler
+import metrics
+from twilio_webhook import create_webhook_app
 
 load_dotenv()
 
@@ -19,24 +32,125 @@ def main():
     api_sid = os.getenv("TWILIO_API_KEY")
     api_secret = os.getenv("TWILIO_API_SECRET")
     conversation_service_id = os.getenv("TWILIO_CONVERSATION_SERVICE_SID")
+    ingestion_mode = os.getenv("TWILIO_INGESTION_MODE", "polling")
+    worker_id = os.getenv("WORKER_ID")
+    partition_store = os.getenv("PARTITION_STORE", "partitions.db")
+    # Workers share the context store, so a taken over conversation keeps its state
+    context_store = os.getenv("CONTEXT_STORE", partition_store if worker_id else "contexts.db")
+
+    if ingestion_mode == "webhook" and not os.getenv("TWILIO_AUTH_TOKEN"):
+        # Checked before anything starts, webhooks can't be verified without it
+        raise SystemExit("TWILIO_AUTH_TOKEN must be set when TWILIO_INGESTION_MODE=webhook")
+
+    if os.getenv("METRICS_PORT"):
+        metrics.start_metrics_server(int(os.getenv("METRICS_PORT")))
+    if os.getenv("METRICS_DUMP_INTERVAL"):
+        metrics.start_periodic_dump(float(os.getenv("METRICS_DUMP_INTERVAL")))
 
     gpt4o = GPT4oMiniClient()
-    deepl = DeepLClient()
-    db_client = DBClient(f"{fast_url}:{fast_port}")
+    deepl = DeepLClient(memory=TranslationMemory(os.getenv("TRANSLATION_MEMORY", "translations.db")))
+    db_client = DBClient(
+        f"{fast_url}:{fast_port}",
+        pool_size=int(os.getenv("DB_POOL_SIZE", DBClient.POOL_SIZE)),
+        read_timeout=float(os.getenv("DB_READ_TIMEOUT", DBClient.READ_TIMEOUT)),
+        user_cache_ttl=float(os.getenv("USER_CACHE_TTL", DBClient.USER_CACHE_TTL))
+    )
     user_service = UserService(gpt4o, deepl, db_client)
-    game_service = GameService(db_client)
+    word_decks = WordDeckPool(
+        db_client,
+        batch_size=int(os.getenv("WORD_DECK_SIZE", WordDeckPool.BATCH_SIZE)),
+        low_water_mark=int(os.getenv("WORD_DECK_LOW_WATER_MARK", WordDeckPool.LOW_WATER_MARK))
+    )
+    progress = ProgressBuffer(
+        db_client,
+        flush_interval=float(os.getenv("PROGRESS_FLUSH_INTERVAL", ProgressBuffer.FLUSH_INTERVAL))
+    )
+    game_service = GameService(db_client, word_decks, progress)
     core_service = CoreService(user_service, game_service)
 
-    twilio_client = TwilioClient(
+    # Several bot processes can share the conversations when each gets its own WORKER_ID
+    partitioner = None
+    if worker_id:
+        partitioner = ConversationPartitioner(LeaseStore(partition_store), worker_id)
+        partitioner.start()
+
+    outbound = OutboundDispatcher(
+        TwilioClient.SYS_USERNAME,
+        account_rate=float(os.getenv("TWILIO_SEND_RATE", OutboundDispatcher.ACCOUNT_RATE)),
+        conversation_rate=float(
+            os.getenv("TWILIO_CONVERSATION_SEND_RATE", OutboundDispatcher.CONVERSATION_RATE)
+        )
+    )
+
+    if ingestion_mode == "webhook":
+        # Polling is only the fallback for lost webhooks, check every conversation rarely
+        fallback_interval = float(os.getenv("TWILIO_FALLBACK_POLL_INTERVAL", "60"))
+        scheduler = PollScheduler(active_interval=fallback_interval,
+                                  idle_interval=fallback_interval,
+                                  max_idle_interval=fallback_interval)
+    else:
+        scheduler = PollScheduler(requests_per_second=float(
+            os.getenv("TWILIO_POLL_BUDGET", PollScheduler.REQUESTS_PER_SECOND)
+        ))
+
+    twilio_options = dict(
         account_sid=account_sid,
         api_key=api_sid,
         api_secret=api_secret,
-        conversation_service_id=conversation_service_id
+        conversation_service_id=conversation_service_id,
+        partitioner=partitioner,
+        outbound=outbound,
+        discovery_interval=float(os.getenv("TWILIO_DISCOVERY_INTERVAL", "60")),
+        scheduler=scheduler,
+        context_store_path=context_store,
+        # Replies are printed instead of sent, e.g. while replaying webhooks locally
+        client=OfflineTwilio(echo=True) if os.getenv("TWILIO_DRY_RUN") == "1" else None
     )
 
+    if ingestion_mode == "async":
+        twilio_client = AsyncTwilioClient(
+            max_concurrency=int(
+                os.getenv("TWILIO_MAX_CONCURRENCY", AsyncTwilioClient.MAX_CONCURRENCY)
+            ),
+            **twilio_options
+        )
+    else:
+        twilio_client = TwilioClient(**twilio_options)
+
     twilio_client.on_message(core_service.handle_message)
     twilio_client.on_command(core_service.handle_command)
-    twilio_client.start_polling()
+
+    outbound.start()
+    progress.start()
+    try:
+        if ingestion_mode == "webhook":
+            start_webhook_server(twilio_client)
+        elif ingestion_mode == "async":
+            asyncio.run(twilio_client.start_polling())
+        else:
+            twilio_client.start_polling()
+    finally:
+        outbound.stop()
+        progress.stop()
+        if partitioner:
+            # Hand our conversations over right away instead of waiting for the leases to expire
+            partitioner.leave()
+
+
+def start_webhook_server(twilio_client: TwilioClient):
+    webhook_app = create_webhook_app(
+        twilio_client,
+        auth_token=os.getenv("TWILIO_AUTH_TOKEN"),
+        public_url=os.getenv("TWILIO_WEBHOOK_URL"),
+    )
+    # Slow polling catches messages whose webhook never arrived
+    threading.Thread(target=twilio_client.start_polling, daemon=True).start()
+
+    uvicorn.run(
+        webhook_app,
+        host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+        port=int(os.getenv("WEBHOOK_PORT", "8080")),
+    )
 
 
 if __name__ == '__main__':
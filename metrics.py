@@ -0,0 +1,159 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        # labels -> [bucket counts..., count, sum, max]
+        self._values: dict[tuple, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * len(self.buckets) + [0, 0.0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-3] += 1
+            series[-2] += value
+            series[-1] = max(series[-1], value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def summary(self) -> dict[tuple, tuple[int, float, float]]:
+        """labels -> (count, average, max)"""
+        with self._lock:
+            return {labels: (int(series[-3]), series[-2] / series[-3], series[-1])
+                    for labels, series in self._values.items() if series[-3]}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, series):
+                    bucket_labels = labels + (("le", str(bound)),)
+                    lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {count}")
+                inf_labels = labels + (("le", "+Inf"),)
+                lines.append(f"{self.name}_bucket{_format_labels(inf_labels)} {series[-3]}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {series[-3]}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-2]}")
+        return lines
+
+
+STAGE_DURATION = Histogram("memomate_stage_duration_seconds",
+                           "Time spent per pipeline stage")
+STAGE_ERRORS = Counter("memomate_stage_errors_total",
+                       "Exceptions raised per pipeline stage")
+EVENTS = Counter("memomate_events_total",
+                 "Things that happened, e.g. polls, received and sent messages")
+
+REGISTRY = [STAGE_DURATION, STAGE_ERRORS, EVENTS]
+
+
+def timed(stage: str):
+    """Decorator recording the duration and the errors of a pipeline stage"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                STAGE_ERRORS.inc(stage=stage)
+                raise
+            finally:
+                STAGE_DURATION.observe(time.perf_counter() - start, stage=stage)
+        return wrapper
+    return decorator
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def render_summary() -> str:
+    lines = [f"{'stage':<32} {'count':>8} {'avg ms':>9} {'max ms':>9}"]
+    for labels, (count, average, maximum) in sorted(STAGE_DURATION.summary().items()):
+        stage = dict(labels).get("stage", "")
+        lines.append(f"{stage:<32} {count:>8} {average * 1000:>9.1f} {maximum * 1000:>9.1f}")
+    return "\n".join(lines)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics in Prometheus text format from a background thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+
+def start_periodic_dump(interval: float):
+    """Print a latency summary of all stages every `interval` seconds"""
+    def dump():
+        while True:
+            time.sleep(interval)
+            print(render_summary())
+
+    threading.Thread(target=dump, name="metrics-dump", daemon=True).start()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, create_engine
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, Index, create_engine, func
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
@@ -40,8 +40,9 @@ class Level(Base):
 
 class Word(Base):
     __tablename__ = "words"
+    # Level ids are stored lower case, compare with level.lower() instead of func.lower()
     word_id = Column(Integer, primary_key=True, autoincrement=True)
-    level_id = Column(String, ForeignKey('level.level_id'))
+    level_id = Column(String, ForeignKey('level.level_id'), index=True)
     de = Column(String, unique=True)
     en = Column(String)
     es = Column(String)
@@ -50,6 +51,13 @@ class Word(Base):
     
     user_associations = relationship("UsersWords", back_populates="word")
     level = relationship("Level", back_populates="words")
+    translations = relationship("WordTranslation", back_populates="word",
+                                passive_deletes=True)
+
+    __table_args__ = (
+        # Case-insensitive lookups by the German word
+        Index("ix_words_de_lower", func.lower(de)),
+    )
 
     def __getitem__(self, item):
         match item:
@@ -64,3 +72,29 @@ class Word(Base):
             case "ru":
                 return self.ru
         return None
+
+
+class WordTranslation(Base):
+    """
+    One translation per row, what the word index and the read endpoints use. The language
+    columns of Word are still written for older clients.
+    """
+    __tablename__ = "word_translations"
+    word_id = Column(Integer, ForeignKey('words.word_id', ondelete="CASCADE"), primary_key=True)
+    lang = Column(String, primary_key=True)
+    text = Column(String, nullable=False)
+
+    word = relationship("Word", back_populates="translations")
+
+    __table_args__ = (
+        # "Words with a usable translation into lang", empty texts are not indexed
+        Index("ix_word_translations_lang_word", "lang", "word_id",
+              sqlite_where=text != ''),
+    )
+
+
+class ProgressBatchLog(Base):
+    """Ids of applied progress batches, a batch the client sends again is not counted twice"""
+    __tablename__ = "progress_batches"
+    batch_id = Column(String, primary_key=True)
+    created_at = Column(Float, nullable=False, index=True)
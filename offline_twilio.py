@@ -0,0 +1,82 @@
+import itertools
+import threading
+from types import SimpleNamespace
+
+
+class OfflineMessage:
+    _sids = itertools.count()
+
+    def __init__(self, index: int, author: str | None, body: str | None):
+        self.sid = f"IMoffline{next(OfflineMessage._sids):024d}"
+        self.index = index
+        self.author = author
+        self.body = body
+
+
+class OfflineMessages:
+    def __init__(self, conversation_sid: str, echo: bool):
+        self._conversation_sid = conversation_sid
+        self._echo = echo
+        self._messages: list[OfflineMessage] = []
+        self._lock = threading.Lock()
+
+    def create(self, *, author: str | None = None, body: str | None = None) -> OfflineMessage:
+        with self._lock:
+            message = OfflineMessage(len(self._messages), author, body)
+            self._messages.append(message)
+        if self._echo:
+            print(f"[{self._conversation_sid}] {author}: {body}")
+        return message
+
+    def stream(self, *, order: str = "asc", page_size: int | None = None):
+        return iter(self.list(order=order))
+
+    def list(self, *, order: str = "asc", limit: int | None = None) -> list[OfflineMessage]:
+        with self._lock:
+            messages = list(self._messages)
+        if order == "desc":
+            messages.reverse()
+        return messages[:limit]
+
+
+class OfflineConversation:
+    def __init__(self, sid: str, echo: bool):
+        self.sid = sid
+        self.state = "active"
+        self.messages = OfflineMessages(sid, echo)
+
+
+class OfflineConversations:
+    def __init__(self, echo: bool):
+        self._echo = echo
+        self._conversations: dict[str, OfflineConversation] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, sid: str) -> OfflineConversation:
+        with self._lock:
+            conversation = self._conversations.get(sid)
+            if not conversation:
+                conversation = self._conversations[sid] = OfflineConversation(sid, self._echo)
+            return conversation
+
+    def stream(self, *, page_size: int | None = None, **filters):
+        with self._lock:
+            return iter(list(self._conversations.values()))
+
+
+class OfflineTwilio:
+    """
+    Stand-in for twilio.rest.Client with the part of the Conversations API TwilioClient uses.
+    Messages live in memory, nothing leaves the process. Used by webhook replays
+    (TWILIO_DRY_RUN=1) and tests.
+    """
+
+    def __init__(self, *, echo: bool = False):
+        # One service, whatever SID is asked for
+        self._service = SimpleNamespace(conversations=OfflineConversations(echo))
+        self.conversations = SimpleNamespace(
+            v1=SimpleNamespace(services=lambda service_sid: self._service)
+        )
+
+    def conversation(self, sid: str) -> OfflineConversation:
+        return self._service.conversations(sid)
@@ -0,0 +1,170 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from typing import Any
+from twilio.base.exceptions import TwilioRestException
+
+from rate_limiter import TokenBucket
+from metrics import STAGE_DURATION, EVENTS
+
+
+class OutboundDispatcher:
+    """
+    Sends messages from a small pool of background threads so handlers never wait for Twilio.
+    A conversation has at most one send in flight, so its messages keep their order.
+    Throttled sends are retried with backoff.
+    """
+    ACCOUNT_RATE = 20
+    CONVERSATION_RATE = 1
+    CONVERSATION_BURST = 3
+    MAX_RETRIES = 5
+    RETRY_BACKOFF = 1
+    RETRY_STATUS_CODES = (429, 503)
+    BUCKET_SWEEP_THRESHOLD = 1000
+    # Sends are bound by Twilio's latency, not by CPU
+    SENDERS = 8
+
+    def __init__(self, author: str, *, account_rate: float = ACCOUNT_RATE,
+                 conversation_rate: float = CONVERSATION_RATE,
+                 conversation_burst: float = CONVERSATION_BURST, senders: int = SENDERS):
+        self._author = author
+        self._senders = senders
+        self._conversation_rate = conversation_rate
+        self._conversation_burst = conversation_burst
+        self._account_bucket = TokenBucket(account_rate)
+        self._conversation_buckets: dict[str, TokenBucket] = {}
+        # Pending messages per conversation, the schedule holds each busy conversation once.
+        # A conversation being sent is in neither, which keeps other senders away from it.
+        self._queues: dict[str, deque] = {}
+        self._schedule: list[tuple[float, int, str]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._stopping = False
+        self._sending = 0
+
+    def start(self):
+        with self._condition:
+            if any(thread.is_alive() for thread in self._threads):
+                return
+            self._stopping = False
+            self._threads = [
+                threading.Thread(target=self._run, name=f"outbound-dispatcher-{i}", daemon=True)
+                for i in range(self._senders)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self):
+        """Send everything still queued, then stop the threads"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def send(self, conversation, body: str, *, on_sent: Callable[[Any], None] | None = None):
+        """Queue a message, on_sent gets the created message from a sender thread"""
+        sid = conversation.sid
+        with self._condition:
+            queue = self._queues.get(sid)
+            if queue is None:
+                queue = self._queues[sid] = deque()
+                self._schedule_conversation(sid, time.monotonic())
+            queue.append([conversation, body, 0, on_sent])
+            self._condition.notify()
+
+    def _schedule_conversation(self, sid: str, ready_at: float):
+        heapq.heappush(self._schedule, (ready_at, next(self._sequence), sid))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                sid = self._next_ready_conversation()
+                if sid is None:
+                    return
+                conversation, body, attempts, on_sent = self._queues[sid][0]
+                self._sending += 1
+
+            try:
+                with STAGE_DURATION.time(stage="twilio.send"):
+                    message = conversation.messages.create(author=self._author, body=body)
+                EVENTS.inc(event="message_sent")
+                if on_sent:
+                    on_sent(message)
+                self._finish(sid)
+            except TwilioRestException as e:
+                if e.status in self.RETRY_STATUS_CODES and attempts < self.MAX_RETRIES:
+                    EVENTS.inc(event="send_throttled")
+                    print(f"Sending to {sid} throttled ({e.status}), retrying...")
+                    self._retry(sid, self.RETRY_BACKOFF * 2 ** attempts)
+                else:
+                    print(f"Error sending message to {sid}: {e}")
+                    self._finish(sid)
+            except Exception as e:
+                print(f"Error sending message to {sid}: {e}")
+                self._finish(sid)
+
+    def _next_ready_conversation(self) -> str | None:
+        """Blocks until a conversation may send, returns None once stopped and drained"""
+        while True:
+            if not self._schedule:
+                # Sends in flight may still queue follow-up messages
+                if self._stopping and not self._sending:
+                    return None
+                self._condition.wait()
+                continue
+
+            ready_at, _, sid = self._schedule[0]
+            wait = ready_at - time.monotonic()
+            if wait > 0:
+                self._condition.wait(wait)
+                continue
+
+            heapq.heappop(self._schedule)
+            bucket = self._conversation_bucket(sid)
+            wait = max(self._account_bucket.time_until_available(),
+                       bucket.time_until_available())
+            if wait > 0 or not self._account_bucket.try_acquire():
+                self._schedule_conversation(sid, time.monotonic() + wait)
+                continue
+
+            bucket.try_acquire()
+            return sid
+
+    def _conversation_bucket(self, sid: str) -> TokenBucket:
+        bucket = self._conversation_buckets.get(sid)
+        if bucket is None:
+            bucket = TokenBucket(self._conversation_rate, self._conversation_burst)
+            self._conversation_buckets[sid] = bucket
+        return bucket
+
+    def _finish(self, sid: str):
+        with self._condition:
+            self._sending -= 1
+            self._condition.notify_all()
+            queue = self._queues[sid]
+            queue.popleft()
+            if queue:
+                self._schedule_conversation(sid, time.monotonic())
+                return
+
+            del self._queues[sid]
+            if len(self._conversation_buckets) > self.BUCKET_SWEEP_THRESHOLD:
+                self._sweep_buckets()
+
+    def _sweep_buckets(self):
+        # A full bucket of an idle conversation holds no state worth keeping
+        for sid, bucket in list(self._conversation_buckets.items()):
+            if sid not in self._queues and bucket.is_full():
+                del self._conversation_buckets[sid]
+
+    def _retry(self, sid: str, delay: float):
+        with self._condition:
+            self._sending -= 1
+            self._queues[sid][0][2] += 1
+            self._schedule_conversation(sid, time.monotonic() + delay)
+            self._condition.notify_all()
@@ -0,0 +1,122 @@
+import heapq
+import itertools
+import threading
+import time
+from collections.abc import Iterable
+
+from rate_limiter import TokenBucket
+
+
+class PollScheduler:
+    """
+    Decides which conversation to poll next. Learners in an active state are polled every
+    ACTIVE_INTERVAL while they keep writing and back off to no more than MAX_ACTIVE_INTERVAL
+    when they pause, a learner thinking about an answer must not wait minutes for the reply.
+    Every other conversation backs off exponentially from IDLE_INTERVAL to MAX_IDLE_INTERVAL
+    while nothing happens, and so do conversations whose polls fail. All polls share a
+    global budget of requests per second.
+    """
+    ACTIVE_INTERVAL = 0.5
+    ACTIVE_WINDOW = 120
+    MAX_ACTIVE_INTERVAL = 5
+    IDLE_INTERVAL = 3
+    MAX_IDLE_INTERVAL = 300
+    REQUESTS_PER_SECOND = 10
+
+    def __init__(self, *, requests_per_second: float = REQUESTS_PER_SECOND,
+                 active_interval: float = ACTIVE_INTERVAL,
+                 idle_interval: float = IDLE_INTERVAL,
+                 max_idle_interval: float = MAX_IDLE_INTERVAL,
+                 max_active_interval: float = MAX_ACTIVE_INTERVAL,
+                 active_window: float = ACTIVE_WINDOW):
+        self._budget = TokenBucket(requests_per_second)
+        self._active_interval = active_interval
+        self._idle_interval = idle_interval
+        self._max_idle_interval = max(max_idle_interval, idle_interval)
+        self._max_active_interval = max(max_active_interval, active_interval)
+        self._active_window = active_window
+        self._lock = threading.Lock()
+        self._heap: list[tuple[float, int, str]] = []
+        self._sequence = itertools.count()
+        # sid -> (sequence, due) of its valid heap entry, older entries are skipped lazily
+        self._scheduled: dict[str, tuple[int, float]] = {}
+        self._in_flight: set[str] = set()
+        self._backoff: dict[str, float] = {}
+        self._last_activity: dict[str, float] = {}
+
+    def sync(self, sids: Iterable[str]):
+        """Poll new conversations right away and forget the ones that are gone"""
+        sids = set(sids)
+        with self._lock:
+            for sid in sids - self._scheduled.keys() - self._in_flight:
+                self._schedule(sid, time.monotonic())
+
+            for sid in (self._scheduled.keys() | self._in_flight) - sids:
+                self._scheduled.pop(sid, None)
+                self._in_flight.discard(sid)
+                self._backoff.pop(sid, None)
+                self._last_activity.pop(sid, None)
+
+    def next_due(self) -> tuple[str | None, float]:
+        """Returns the next conversation to poll, or None and how long to wait"""
+        with self._lock:
+            while self._heap:
+                due, sequence, sid = self._heap[0]
+                if self._scheduled.get(sid, (None,))[0] != sequence:
+                    heapq.heappop(self._heap)
+                    continue
+
+                wait = due - time.monotonic()
+                if wait > 0:
+                    return None, wait
+                if not self._budget.try_acquire():
+                    return None, self._budget.time_until_available()
+
+                heapq.heappop(self._heap)
+                del self._scheduled[sid]
+                self._in_flight.add(sid)
+                return sid, 0
+
+            return None, self._idle_interval
+
+    def report(self, sid: str, *, active: bool, had_messages: bool, failed: bool = False):
+        """Schedule the next poll of a conversation after it was polled"""
+        now = time.monotonic()
+        with self._lock:
+            if sid not in self._in_flight:
+                return
+            self._in_flight.discard(sid)
+
+            if had_messages:
+                self._last_activity[sid] = now
+                self._backoff.pop(sid, None)
+
+            last_activity = self._last_activity.get(sid, float("-inf"))
+            if failed:
+                # Don't hammer a conversation (or an API) that keeps failing
+                interval = self._backoff.get(sid, self._idle_interval / 2) * 2
+                interval = min(interval, self._max_idle_interval)
+                self._backoff[sid] = interval
+            elif had_messages or (active and now - last_activity < self._active_window):
+                interval = self._active_interval
+            else:
+                interval = self._backoff.get(sid, self._idle_interval / 2) * 2
+                interval = min(interval, self._max_active_interval if active
+                               else self._max_idle_interval)
+                self._backoff[sid] = interval
+
+            self._schedule(sid, now + interval)
+
+    def touch(self, sid: str):
+        """Something happened outside of polling (e.g. a webhook), poll again soon"""
+        now = time.monotonic()
+        with self._lock:
+            self._last_activity[sid] = now
+            self._backoff.pop(sid, None)
+            if sid in self._scheduled and self._scheduled[sid][1] > now + self._active_interval:
+                self._schedule(sid, now + self._active_interval)
+
+    def _schedule(self, sid: str, due: float):
+        sequence = next(self._sequence)
+        self._scheduled[sid] = (sequence, due)
+        heapq.heappush(self._heap, (due, sequence, sid))
@@ -0,0 +1,120 @@
+import threading
+import uuid
+
+from db_client import DBClient
+from metrics import EVENTS
+
+
+class ProgressBuffer:
+    """
+    Write-behind buffer for correct answers. Increments are merged per (user, word) in memory
+    and written in one batch every FLUSH_INTERVAL seconds, when MAX_PENDING pairs are waiting,
+    or when a learner stops the session. Batches that fail in transit or with a server error
+    are sent again unchanged with the next flush, under the same batch id: after a timeout
+    the server may have applied them already and must be able to tell. Batches the server
+    rejects (4xx) are dropped.
+    """
+    FLUSH_INTERVAL = 10
+    MAX_PENDING = 500
+    # Same limit as MAX_BULK_WORDS of the API
+    MAX_BATCH_SIZE = 1000
+
+    def __init__(self, db: DBClient, *, flush_interval: float = FLUSH_INTERVAL,
+                 max_pending: int = MAX_PENDING):
+        self._db = db
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._pending: dict[tuple[str, int], int] = {}
+        # (batch id, batch) that were sent but not confirmed, oldest first
+        self._unconfirmed: list[tuple[str, dict[tuple[str, int], int]]] = []
+        self._lock = threading.Lock()
+        # Only one batch is in flight, so unconfirmed batches are resent in order
+        self._flush_lock = threading.Lock()
+        self._wake_up = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def add(self, sid: str, word_id: int, amount: int = 1):
+        with self._lock:
+            key = (sid, word_id)
+            self._pending[key] = self._pending.get(key, 0) + amount
+            full = len(self._pending) >= self._max_pending
+            start = self._thread is None
+
+        if start:
+            self.start()
+        if full:
+            self._wake_up.set()
+
+    def flush(self, sid: str | None = None):
+        """Write the pending increments of one user, or all of them"""
+        with self._flush_lock:
+            # Until the older batches went through, new increments keep merging in memory
+            self._send_unconfirmed()
+
+            with self._lock:
+                if sid is None:
+                    batch, self._pending = self._pending, {}
+                else:
+                    batch = {key: amount for key, amount in self._pending.items()
+                             if key[0] == sid}
+                    for key in batch:
+                        del self._pending[key]
+
+            items = list(batch.items())
+            for start in range(0, len(items), ProgressBuffer.MAX_BATCH_SIZE):
+                chunk = dict(items[start:start + ProgressBuffer.MAX_BATCH_SIZE])
+                self._unconfirmed.append((uuid.uuid4().hex, chunk))
+            self._send_unconfirmed()
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="progress-buffer",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and write what is still pending"""
+        self._stopped.set()
+        self._wake_up.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+
+    def __len__(self):
+        return len(self._pending) + sum(len(chunk) for _, chunk in self._unconfirmed)
+
+    def _send_unconfirmed(self):
+        """Called with the flush lock held, raises if a batch failed and may be sent again"""
+        while self._unconfirmed:
+            batch_id, chunk = self._unconfirmed[0]
+            try:
+                self._db.increase_progress_batch(chunk, batch_id=batch_id)
+                EVENTS.inc(len(chunk), event="progress_flushed")
+            except Exception as e:
+                if not self._is_rejected(e):
+                    raise
+                # Sending it again would fail the same way and block everything after it
+                print(f"Dropping {len(chunk)} progress entries rejected by the API: {e}")
+                EVENTS.inc(len(chunk), event="progress_rejected")
+            self._unconfirmed.pop(0)
+
+    @staticmethod
+    def _is_rejected(error: Exception) -> bool:
+        """The API answered with a client error, unlike transport errors and 5xx"""
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+        return status_code is not None and 400 <= status_code < 500
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake_up.wait(self._flush_interval)
+            self._wake_up.clear()
+            if self._stopped.is_set():
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing progress: {e}")
@@ -0,0 +1,29 @@
+import sqlite3
+import threading
+
+
+class SharedConnection:
+    """
+    One SQLite connection in autocommit and WAL mode, shared by all threads of a process.
+    Statements run under a lock and rows are read before it is released, other processes
+    may use the same file at the same time.
+    """
+
+    def __init__(self, path: str, schema: str):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=10, check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(schema)
+
+    def execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._connection.execute(sql, params)
+
+    def executemany(self, sql: str, rows: list[tuple]):
+        with self._lock:
+            self._connection.executemany(sql, rows)
+
+    def query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._lock:
+            return self._connection.execute(sql, params).fetchall()
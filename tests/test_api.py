@@ -0,0 +1,209 @@
+import os
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    # The app opens database.db in the working directory
+    directory = tmp_path_factory.mktemp("api")
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        from app.fast_api_client import app
+        with TestClient(app) as client:
+            yield client
+    finally:
+        os.chdir(cwd)
+
+
+def reload_word_index(api: TestClient):
+    from app.fast_api_client import AsyncSessionLocal, load_word_index
+
+    async def reload():
+        async with AsyncSessionLocal() as db:
+            await load_word_index(db)
+
+    api.portal.call(reload)
+
+
+def create_words(api: TestClient, level: str, words: list[dict]) -> int:
+    response = api.post("/words/bulk", json={"level_id": level, "words": words})
+    assert response.status_code == 200
+    return response.json()["count"]
+
+
+def test_word_index_is_read_from_word_translations(api):
+    create_words(api, "hard", [{"de": "Eichhörnchen", "en": "squirrel", "es": "ardilla"}])
+    with sqlite3.connect("database.db") as connection:
+        word_id, = connection.execute(
+            "SELECT word_id FROM words WHERE de = 'Eichhörnchen'"
+        ).fetchone()
+        # Only in the table, not in the ua column
+        connection.execute("INSERT INTO word_translations VALUES (?, 'ua', 'білка')", (word_id,))
+        connection.execute(
+            "DELETE FROM word_translations WHERE word_id = ? AND lang = 'es'", (word_id,)
+        )
+
+    reload_word_index(api)
+
+    response = api.get("/words/random/ua", params={"level": "hard"})
+    assert response.json() == {"word_id": word_id, "de": "Eichhörnchen", "translation": "білка"}
+    assert api.get("/words/random/es", params={"level": "hard"}).status_code == 404
+    assert api.get("/words/coverage/es/hard").json()["count"] == 0
+
+
+def test_known_words_come_in_word_id_order(api):
+    create_words(api, "easy", [{"de": "Zitrone", "es": "limón"}])
+    create_words(api, "easy", [{"de": "Apfel", "es": "manzana"}])
+    create_words(api, "hard", [{"de": "Mandarine"}])
+
+    known = api.get("/words/known/es/easy").json()
+
+    # Zitrone and Apfel are translated, Mandarine is on another level
+    assert [word for word in known if word in {"Zitrone", "Apfel", "Mandarine"}] == \
+        ["Zitrone", "Apfel", "Mandarine"]
+
+
+def test_random_words_come_from_the_requested_language_and_level(api):
+    create_words(api, "easy", [{"de": f"Zufall {i}", "ru": f"случай {i}"} for i in range(5)])
+    create_words(api, "hard", [{"de": "Zufall schwer", "ru": "случай трудный"}])
+
+    single = api.get("/words/random/ru", params={"level": "easy"}).json()
+    batch = api.get("/words/random/ru", params={"level": "easy", "count": 10}).json()
+
+    assert single["de"].startswith("Zufall ") and single["de"] != "Zufall schwer"
+    assert sorted(word["de"] for word in batch) == [f"Zufall {i}" for i in range(5)]
+    assert len(api.get("/words/random/ru", params={"count": 10}).json()) == 6
+
+
+def test_random_word_errors(api):
+    assert api.get("/words/random/xx").status_code == 400
+    assert api.get("/words/random/ru", params={"count": 0}).status_code == 422
+    assert api.get("/words/random/ru", params={"level": "unknown"}).status_code == 404
+
+
+def word_row(de: str) -> tuple:
+    with sqlite3.connect("database.db") as connection:
+        return connection.execute(
+            "SELECT level_id, en, es FROM words WHERE de = ?", (de,)
+        ).fetchone()
+
+
+def test_bulk_upsert_merges_translations(api):
+    assert create_words(api, "easy", [
+        {"de": "Brot", "en": "bread"},
+        {"de": "Brot", "es": "pan"},
+        {"de": "Milch", "en": "milk"},
+    ]) == 2
+    assert word_row("Brot") == ("easy", "bread", "pan")
+
+    # Existing words keep their level and translations that are not sent again
+    assert create_words(api, "hard", [{"de": "Milch", "es": "leche"}]) == 1
+    assert word_row("Milch") == ("easy", "milk", "leche")
+    assert api.get("/words/coverage/es/easy").json()["count"] >= 2
+
+
+def test_bulk_upsert_validation(api):
+    too_many = [{"de": f"Wort {i}"} for i in range(1001)]
+
+    assert api.post("/words/bulk", json={"level_id": "easy", "words": too_many}).status_code == 422
+    assert api.post("/words/bulk", json={"level_id": "medium", "words": []}).status_code == 400
+    assert create_words(api, "easy", []) == 0
+
+
+def create_user(api: TestClient, user_id: str) -> dict:
+    response = api.post("/users/create", json={
+        "user_id": user_id, "user_name": "Test", "level_id": "easy",
+        "from_code2": "de", "to_code2": "en",
+    })
+    assert response.status_code == 200
+    return response.json()
+
+
+def correct_counts(user_id: str) -> dict[int, int]:
+    with sqlite3.connect("database.db") as connection:
+        return dict(connection.execute(
+            "SELECT word_id, correct_count FROM users_words WHERE user_id = ?", (user_id,)
+        ))
+
+
+def test_progress_batch_adds_to_existing_counts(api):
+    create_user(api, "CHprogress")
+    api.post("/words/update_correct_count/CHprogress/1")
+
+    response = api.post("/words/progress/batch", json={"progress": [
+        {"user_id": "CHprogress", "word_id": 1, "count": 2},
+        {"user_id": "CHprogress", "word_id": 2, "count": 5},
+    ]})
+
+    assert response.json() == {"count": 2}
+    assert correct_counts("CHprogress") == {1: 3, 2: 5}
+
+
+def test_progress_batch_is_applied_once_per_batch_id(api):
+    create_user(api, "CHretry")
+    batch = {"batch_id": "retried", "progress": [{"user_id": "CHretry", "word_id": 1, "count": 2}]}
+
+    assert api.post("/words/progress/batch", json=batch).json() == {"count": 1}
+    # Sent again after a timeout
+    assert api.post("/words/progress/batch", json=batch).json() == {"count": 1}
+    assert correct_counts("CHretry") == {1: 2}
+
+    api.post("/words/progress/batch", json=batch | {"batch_id": "next"})
+    assert correct_counts("CHretry") == {1: 4}
+
+
+def test_progress_batch_validation(api):
+    item = {"user_id": "CHprogress", "word_id": 3, "count": 1}
+
+    assert api.post("/words/progress/batch",
+                    json={"progress": [item] * 1001}).status_code == 422
+    assert api.post("/words/progress/batch",
+                    json={"progress": [item | {"count": 0}]}).status_code == 422
+    assert api.post("/words/progress/batch", json={"progress": []}).json() == {"count": 0}
+    assert 3 not in correct_counts("CHprogress")
+
+
+def coverage(api: TestClient) -> dict[tuple[str, str], int]:
+    return {(entry["lang"], entry["level"]): entry["count"]
+            for entry in api.get("/words/coverage").json()}
+
+
+def test_coverage_follows_writes(api):
+    before = coverage(api)
+    create_words(api, "hard", [{"de": "Gletscher", "ua": "льодовик", "en": "glacier"}])
+    after = coverage(api)
+
+    assert after[("ua", "hard")] == before.get(("ua", "hard"), 0) + 1
+    assert after[("en", "hard")] == before.get(("en", "hard"), 0) + 1
+    assert api.get("/words/coverage/ua/HARD").json() == \
+        {"lang": "ua", "level": "hard", "count": after[("ua", "hard")]}
+    assert api.get("/words/translation/ua/hard").json() == {"has_translation": True}
+    assert api.get("/words/translation/ru/unknown").json() == {"has_translation": False}
+    assert api.get("/words/coverage/xx/hard").status_code == 400
+
+
+def test_coverage_is_revalidated_by_etag(api):
+    response = api.get("/words/coverage")
+    etag = response.headers["ETag"]
+
+    not_modified = api.get("/words/coverage", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304 and not_modified.content == b""
+
+    create_words(api, "easy", [{"de": "Regenbogen", "en": "rainbow"}])
+    changed = api.get("/words/coverage", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+
+
+def test_user_profile_is_revalidated_by_etag(api):
+    assert api.get("/users/CHetag").status_code == 404
+    create_user(api, "CHetag")
+
+    response = api.get("/users/CHetag")
+    assert response.json()["user_id"] == "CHetag"
+    assert api.get("/users/CHetag",
+                   headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+    assert api.get("/users/CHetag", headers={"If-None-Match": '"stale"'}).status_code == 200
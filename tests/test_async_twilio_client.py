@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from async_twilio_client import AsyncTwilioClient
+from offline_twilio import OfflineTwilio
+from poll_scheduler import PollScheduler
+from twilio_client import TwilioClient
+
+LEARNER = "whatsapp:+490000000000"
+
+
+def make_client(twilio: OfflineTwilio, handle_message) -> AsyncTwilioClient:
+    scheduler = PollScheduler(active_interval=0.01, idle_interval=0.01, max_idle_interval=0.05)
+    client = AsyncTwilioClient(account_sid="ACtest", api_key="SKtest", api_secret="secret",
+                               conversation_service_id="IStest", client=twilio,
+                               scheduler=scheduler, max_concurrency=4)
+    client.on_message(handle_message)
+    client.on_command(lambda context, command: None)
+    return client
+
+
+def start(client: AsyncTwilioClient) -> threading.Thread:
+    polling = threading.Thread(target=asyncio.run, args=(client.start_polling(),))
+    polling.start()
+    # Conversations that start after the bot, so their first messages are not skipped
+    time.sleep(0.1)
+    return polling
+
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+@pytest.fixture(autouse=True)
+def fast_sync(monkeypatch):
+    monkeypatch.setattr(TwilioClient, "SYNC_INTERVAL", 0.05)
+
+
+def test_conversations_run_concurrently_and_keep_their_order(no_network):
+    twilio = OfflineTwilio()
+    handled = {"CHslow": [], "CHfast": []}
+    slow_started, fast_handled = threading.Event(), threading.Event()
+    waited_for_fast = []
+
+    def handle_message(context):
+        if context.message == "slow 0":
+            slow_started.set()
+            # Only returns early if the other conversation is handled meanwhile
+            waited_for_fast.append(fast_handled.wait(5))
+        handled[context.sid].append(context.message)
+        if context.sid == "CHfast":
+            fast_handled.set()
+
+    client = make_client(twilio, handle_message)
+    polling = start(client)
+    try:
+        for i in range(5):
+            twilio.conversation("CHslow").messages.create(author=LEARNER, body=f"slow {i}")
+        client.register_conversation("CHslow")
+        slow_started.wait(5)
+        twilio.conversation("CHfast").messages.create(author=LEARNER, body="fast")
+        client.register_conversation("CHfast")
+        wait_for(lambda: len(handled["CHslow"]) == 5)
+    finally:
+        client.stop_polling()
+        polling.join(5)
+
+    assert waited_for_fast == [True]
+    assert handled == {"CHslow": [f"slow {i}" for i in range(5)], "CHfast": ["fast"]}
+
+
+def test_stop_drains_the_inboxes_and_shuts_down_the_executor(no_network):
+    twilio = OfflineTwilio()
+    handled = []
+
+    def handle_message(context):
+        time.sleep(0.05)
+        handled.append(context.message)
+
+    client = make_client(twilio, handle_message)
+    polling = start(client)
+    try:
+        for i in range(5):
+            twilio.conversation("CHdrain").messages.create(author=LEARNER, body=f"message {i}")
+        client.register_conversation("CHdrain")
+        wait_for(lambda: handled)
+    finally:
+        client.stop_polling()
+        polling.join(5)
+
+    assert not polling.is_alive()
+    # Fetched before the stop, so handled before start_polling returned
+    assert handled == [f"message {i}" for i in range(5)]
+    assert client._inboxes == {} and client._workers == {}
+    with pytest.raises(RuntimeError):
+        client._executor.submit(print)
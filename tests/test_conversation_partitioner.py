@@ -0,0 +1,72 @@
+import threading
+import time
+
+from conversation_partitioner import ConversationPartitioner, LeaseStore
+
+SIDS = [f"CH{i:032x}" for i in range(50)]
+
+
+def make_partitioner(path: str, worker_id: str, **options) -> ConversationPartitioner:
+    return ConversationPartitioner(LeaseStore(path), worker_id, **options)
+
+
+def test_leases_outlive_a_blocked_poll_loop(tmp_path):
+    path = str(tmp_path / "partitions.db")
+    first = make_partitioner(path, "first", lease_ttl=0.3, heartbeat_interval=0.05)
+    first.start()
+    try:
+        assert first.owns(SIDS[0])
+        # A slow handler, neither refresh() nor owns() is called for longer than the TTL
+        time.sleep(0.6)
+
+        second = make_partitioner(path, "second", lease_ttl=0.3, heartbeat_interval=0.05)
+        assert LeaseStore(path).live_workers(ttl=0.3) == ["first"]
+        assert not second.owns(SIDS[0])
+    finally:
+        first.leave()
+
+    assert second.owns(SIDS[0])
+
+
+def test_workers_split_the_conversations(tmp_path):
+    path = str(tmp_path / "partitions.db")
+    first = make_partitioner(path, "first", heartbeat_interval=0.05)
+    second = make_partitioner(path, "second", heartbeat_interval=0.05)
+    first.start()
+    second.start()
+    try:
+        first.refresh()
+        second.refresh()
+        owned_by_first = {sid for sid in SIDS if first.owns(sid)}
+        owned_by_second = {sid for sid in SIDS if second.owns(sid)}
+    finally:
+        first.leave()
+        second.leave()
+
+    assert owned_by_first and owned_by_second
+    assert owned_by_first.isdisjoint(owned_by_second)
+    assert owned_by_first | owned_by_second == set(SIDS)
+
+
+def test_store_is_safe_to_share_between_threads(tmp_path):
+    store = LeaseStore(str(tmp_path / "partitions.db"))
+    errors = []
+
+    def work(worker_id: str):
+        try:
+            for i in range(200):
+                store.heartbeat(worker_id)
+                store.acquire(f"CH{worker_id}{i}", worker_id, ttl=30)
+                store.record_progress(f"CH{worker_id}{i}", i)
+                assert store.last_message_index(f"CH{worker_id}{i}") == i
+                assert worker_id in store.live_workers(ttl=30)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(f"w{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
@@ -0,0 +1,104 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from constants import LearningLanguage, LearningLevel
+from db_client import DBClient
+
+USER = {"user_id": "CHuser", "user_name": "", "level_id": "easy",
+        "from_code2": "DE", "to_code2": "EN"}
+
+
+def response(status_code: int, body=None, etag: str | None = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode() if body is not None else b""
+    if etag:
+        response.headers["ETag"] = etag
+    return response
+
+
+class FakeSession:
+    """Answers requests with queued responses and records what was asked"""
+
+    def __init__(self, *responses: requests.Response):
+        self.requests = []
+        self._responses = list(responses)
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append(("GET", url, headers))
+        return self._responses.pop(0)
+
+    def post(self, url, json=None, **kwargs):
+        self.requests.append(("POST", url, json))
+        return self._responses.pop(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr("ttl_cache.time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def make_client(session: FakeSession) -> DBClient:
+    client = DBClient("localhost:8000")
+    client._session = session
+    return client
+
+
+def test_users_are_served_from_the_cache(clock):
+    session = FakeSession(response(200, USER))
+    client = make_client(session)
+
+    assert client.get_user("CHuser") == USER
+    assert client.get_user("CHuser") == USER
+    assert len(session.requests) == 1
+
+    clock.value += DBClient.USER_CACHE_TTL + 1
+    session._responses.append(response(200, USER))
+    assert client.get_user("CHuser") == USER
+    assert len(session.requests) == 2
+
+
+def test_unknown_users_are_remembered_briefly(clock):
+    session = FakeSession(response(404, {"detail": "User not found"}))
+    client = make_client(session)
+
+    assert client.get_user("CHuser") is None
+    assert client.get_user("CHuser") is None
+    assert len(session.requests) == 1
+
+    # Onboarded by another worker meanwhile
+    clock.value += DBClient.USER_NOT_FOUND_TTL + 1
+    session._responses.append(response(200, USER))
+    assert client.get_user("CHuser") == USER
+    assert len(session.requests) == 2
+
+
+@pytest.mark.parametrize("status_code", [200, 500])
+def test_creating_a_user_invalidates_the_cache(clock, status_code):
+    session = FakeSession(response(404), response(status_code, USER), response(200, USER))
+    client = make_client(session)
+    assert client.get_user("CHuser") is None
+
+    try:
+        client.create_user("CHuser", LearningLevel.EASY, LearningLanguage.EN)
+    except requests.HTTPError:
+        # Whether the user was created is unknown, ask again
+        pass
+
+    assert client.get_user("CHuser") == USER
+    assert [method for method, _, _ in session.requests] == ["GET", "POST", "GET"]
+
+
+def test_responses_are_revalidated_by_etag(clock):
+    coverage = {"lang": "en", "level": "easy", "count": 3}
+    session = FakeSession(response(200, coverage, etag='"v1"'), response(304))
+    client = make_client(session)
+
+    assert client.word_count(LearningLanguage.EN, LearningLevel.EASY) == 3
+    assert client.word_count(LearningLanguage.EN, LearningLevel.EASY) == 3
+    assert session.requests[1][2] == {"If-None-Match": '"v1"'}
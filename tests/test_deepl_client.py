@@ -0,0 +1,47 @@
+import pytest
+
+from constants import LearningLanguage
+from deepl_client import DeepLClient
+from fake_deepl_server import FakeDeepLServer
+from translation_memory import TranslationMemory
+
+
+@pytest.fixture
+def deepl_server():
+    server = FakeDeepLServer().start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def deepl_api_key(monkeypatch):
+    monkeypatch.setenv("DEEPL_API_KEY", "test-key")
+
+
+def test_texts_are_translated_in_batches_in_order(deepl_server):
+    client = DeepLClient(api_url=deepl_server.url)
+    texts = [f"Wort {i}" for i in range(120)]
+
+    translations = client.translate_texts(texts, target_lang=LearningLanguage.EN)
+
+    assert translations == [f"Wort {i} [EN]" for i in range(120)]
+    assert sorted(len(request) for request in deepl_server.requests) == [20, 50, 50]
+
+
+def test_large_texts_are_split_by_request_size():
+    texts = ["x" * 50_000] * 5
+
+    assert [len(chunk) for chunk in DeepLClient._chunks(texts)] == [2, 2, 1]
+
+
+def test_translation_memory_saves_requests(deepl_server, tmp_path):
+    client = DeepLClient(api_url=deepl_server.url,
+                         memory=TranslationMemory(str(tmp_path / "translations.db")))
+
+    first = client.translate_texts(["Haus", "Baum", "Haus"], target_lang=LearningLanguage.ES)
+    second = client.translate_texts(["Baum", " Haus", "Wolke"], target_lang=LearningLanguage.ES)
+
+    assert first == ["Haus [ES]", "Baum [ES]", "Haus [ES]"]
+    assert second == ["Baum [ES]", "Haus [ES]", "Wolke [ES]"]
+    assert deepl_server.requests == [["Haus", "Baum"], ["Wolke"]]
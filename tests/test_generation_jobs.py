@@ -0,0 +1,52 @@
+import threading
+
+from constants import LearningLanguage, LearningLevel
+from generation_jobs import GenerationJobQueue
+
+
+def test_requests_for_the_same_deck_share_one_job():
+    release = threading.Event()
+    runs = []
+
+    def generate(job):
+        runs.append((job.lang, job.level))
+        job.report(5)
+        release.wait(5)
+
+    queue = GenerationJobQueue(generate)
+    first = queue.submit(LearningLanguage.EN, LearningLevel.EASY)
+    second = queue.submit(LearningLanguage.EN, LearningLevel.EASY)
+    other = queue.submit(LearningLanguage.ES, LearningLevel.EASY)
+
+    assert first is second and first is not other
+    assert first.wait_for_first_words(5) and first.stored == 5
+    assert not first.is_done()
+
+    release.set()
+    assert first.wait(5) and other.wait(5)
+    assert set(runs) == {(LearningLanguage.EN, LearningLevel.EASY),
+                         (LearningLanguage.ES, LearningLevel.EASY)}
+    assert len(runs) == 2
+    assert queue.jobs() == []
+
+
+def test_finished_jobs_are_replaced_by_new_ones():
+    queue = GenerationJobQueue(lambda job: job.report(1))
+
+    first = queue.submit(LearningLanguage.EN, LearningLevel.HARD)
+    first.wait(5)
+    second = queue.submit(LearningLanguage.EN, LearningLevel.HARD)
+
+    assert second is not first
+    assert second.wait(5)
+
+
+def test_errors_end_the_job_and_wake_up_waiters():
+    def generate(job):
+        raise RuntimeError("LLM unavailable")
+
+    job = GenerationJobQueue(generate).submit(LearningLanguage.RU, LearningLevel.EASY)
+
+    assert job.wait_for_first_words(5)
+    assert job.wait(5)
+    assert isinstance(job.error, RuntimeError) and job.stored == 0
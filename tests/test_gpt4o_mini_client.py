@@ -0,0 +1,32 @@
+from gpt4o_mini_client import JsonWordStreamParser
+
+
+def parse(*chunks: str) -> list[str]:
+    parser = JsonWordStreamParser()
+    return [word for chunk in chunks for word in parser.feed(chunk)]
+
+
+def test_words_are_returned_when_their_string_closes():
+    parser = JsonWordStreamParser()
+
+    assert parser.feed('{"words": ["Ha') == []
+    assert parser.feed('us", "Ba') == ["Haus"]
+    assert parser.feed('um"]}') == ["Baum"]
+
+
+def test_keys_and_nested_object_strings_are_skipped():
+    reply = '{"words": ["Haus", {"de": "Baum"}, ["Wolke"]], "count": "3"}'
+
+    assert parse(reply) == ["Haus", "Wolke"]
+
+
+def test_escapes_are_decoded_across_chunks():
+    assert parse('["Caf\\u00', 'e9", "sag \\', '"Hallo\\""]') == ["Café", 'sag "Hallo"']
+
+
+def test_brackets_inside_strings_do_not_change_the_structure():
+    assert parse('{"words": ["[x]", "{y}", "z"]}') == ["[x]", "{y}", "z"]
+
+
+def test_words_before_a_broken_tail_are_kept():
+    assert parse('{"words": ["Haus", "Baum", "Wol') == ["Haus", "Baum"]
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from twilio.base.exceptions import TwilioRestException
+
+from offline_twilio import OfflineConversation
+from outbound_dispatcher import OutboundDispatcher
+
+AUTHOR = "bot"
+
+
+class ThrottledConversation(OfflineConversation):
+    """Answers the first `throttled` sends with 429"""
+
+    def __init__(self, sid: str, throttled: int):
+        super().__init__(sid, echo=False)
+        self._create = self.messages.create
+        self._throttled = throttled
+        self.attempts = 0
+        self.messages.create = self.create
+
+    def create(self, **kwargs):
+        self.attempts += 1
+        if self.attempts <= self._throttled:
+            raise TwilioRestException(429, "/Messages", "Too Many Requests")
+        return self._create(**kwargs)
+
+
+class SlowConversation(OfflineConversation):
+    """Takes `latency` seconds per send and records how many sends overlap"""
+
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def __init__(self, sid: str, latency: float):
+        super().__init__(sid, echo=False)
+        self._create = self.messages.create
+        self._latency = latency
+        self._sending = False
+        self.overlapped = False
+        self.messages.create = self.create
+
+    def create(self, **kwargs):
+        with SlowConversation.lock:
+            self.overlapped |= self._sending
+            self._sending = True
+            SlowConversation.in_flight += 1
+            SlowConversation.max_in_flight = max(SlowConversation.max_in_flight,
+                                                 SlowConversation.in_flight)
+        time.sleep(self._latency)
+        with SlowConversation.lock:
+            self._sending = False
+            SlowConversation.in_flight -= 1
+        return self._create(**kwargs)
+
+
+def bodies(conversation: OfflineConversation) -> list[str]:
+    return [message.body for message in conversation.messages.list()]
+
+
+def test_messages_keep_their_order_per_conversation():
+    dispatcher = OutboundDispatcher(AUTHOR, account_rate=1000, conversation_rate=1000,
+                                    conversation_burst=1000)
+    first, second = OfflineConversation("CH1", echo=False), OfflineConversation("CH2", echo=False)
+    dispatcher.start()
+    for i in range(20):
+        dispatcher.send(first, f"first {i}")
+        dispatcher.send(second, f"second {i}")
+    dispatcher.stop()
+
+    assert bodies(first) == [f"first {i}" for i in range(20)]
+    assert bodies(second) == [f"second {i}" for i in range(20)]
+    assert {message.author for message in first.messages.list()} == {AUTHOR}
+
+
+def test_throttled_sends_are_retried_before_later_messages(monkeypatch):
+    monkeypatch.setattr(OutboundDispatcher, "RETRY_BACKOFF", 0.01)
+    dispatcher = OutboundDispatcher(AUTHOR, account_rate=1000, conversation_rate=1000,
+                                    conversation_burst=1000)
+    conversation = ThrottledConversation("CH1", throttled=2)
+    dispatcher.start()
+    dispatcher.send(conversation, "one")
+    dispatcher.send(conversation, "two")
+    dispatcher.stop()
+
+    assert conversation.attempts == 4
+    assert bodies(conversation) == ["one", "two"]
+
+
+def test_sends_give_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(OutboundDispatcher, "RETRY_BACKOFF", 0.001)
+    dispatcher = OutboundDispatcher(AUTHOR, account_rate=1000, conversation_rate=1000,
+                                    conversation_burst=1000)
+    conversation = ThrottledConversation("CH1", throttled=100)
+    dispatcher.start()
+    dispatcher.send(conversation, "lost")
+    dispatcher.stop()
+
+    assert conversation.attempts == OutboundDispatcher.MAX_RETRIES + 1
+    assert bodies(conversation) == []
+
+
+def test_conversations_are_sent_in_parallel_but_one_send_at_a_time_each():
+    dispatcher = OutboundDispatcher(AUTHOR, account_rate=1000, conversation_rate=1000,
+                                    conversation_burst=1000, senders=4)
+    conversations = [SlowConversation(f"CH{i}", latency=0.05) for i in range(4)]
+    dispatcher.start()
+    started = time.monotonic()
+    for i in range(5):
+        for conversation in conversations:
+            dispatcher.send(conversation, f"message {i}")
+    dispatcher.stop()
+
+    # 20 sends of 50ms, one sender alone would need a second
+    assert time.monotonic() - started < 0.8
+    assert SlowConversation.max_in_flight > 1
+    for conversation in conversations:
+        assert not conversation.overlapped
+        assert bodies(conversation) == [f"message {i}" for i in range(5)]
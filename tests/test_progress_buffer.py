@@ -0,0 +1,128 @@
+import pytest
+import requests
+
+from progress_buffer import ProgressBuffer
+
+
+def http_error(status_code: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(f"{status_code} Error", response=response)
+
+
+class FakeDB:
+    def __init__(self, *errors: Exception):
+        self.batches = []
+        self.batch_ids = []
+        self._errors = list(errors)
+
+    def increase_progress_batch(self, progress: dict[tuple[str, int], int],
+                                batch_id: str | None = None):
+        self.batches.append(dict(progress))
+        self.batch_ids.append(batch_id)
+        if self._errors:
+            error = self._errors.pop(0)
+            if error:
+                raise error
+
+
+def fill(buffer: ProgressBuffer, entries: int):
+    for word_id in range(entries):
+        buffer.add(f"CH{word_id % 7}", word_id)
+
+
+def make_buffer(db: FakeDB) -> ProgressBuffer:
+    # A long interval keeps the background thread out of the way
+    return ProgressBuffer(db, flush_interval=3600, max_pending=10_000)
+
+
+def test_increments_are_merged_per_user_and_word():
+    db = FakeDB()
+    buffer = make_buffer(db)
+    buffer.add("CH1", 1)
+    buffer.add("CH1", 1)
+    buffer.add("CH1", 2, amount=3)
+    buffer.add("CH2", 1)
+
+    buffer.flush("CH1")
+    assert db.batches == [{("CH1", 1): 2, ("CH1", 2): 3}]
+    assert len(buffer) == 1
+
+    buffer.flush()
+    assert db.batches[1] == {("CH2", 1): 1}
+    assert len(buffer) == 0
+
+
+def test_large_flush_is_split_into_api_sized_batches():
+    db = FakeDB()
+    buffer = make_buffer(db)
+    fill(buffer, 1200)
+
+    buffer.flush()
+
+    assert [len(batch) for batch in db.batches] == [1000, 200]
+    assert len(buffer) == 0
+
+
+def test_rejected_batches_are_dropped():
+    db = FakeDB(http_error(422), http_error(422))
+    buffer = make_buffer(db)
+    fill(buffer, 1200)
+
+    buffer.flush()
+    buffer.flush()
+
+    # Not resent on every flush
+    assert [len(batch) for batch in db.batches] == [1000, 200]
+    assert len(buffer) == 0
+
+
+def test_rejected_batch_does_not_hold_back_the_next_one():
+    db = FakeDB(http_error(400), None)
+    buffer = make_buffer(db)
+    fill(buffer, 1200)
+
+    buffer.flush()
+
+    assert [len(batch) for batch in db.batches] == [1000, 200]
+    assert len(buffer) == 0
+
+
+@pytest.mark.parametrize("error", [http_error(503), requests.ConnectionError("refused"),
+                                   requests.ReadTimeout("read timed out")])
+def test_failed_batches_are_resent_unchanged_with_their_batch_id(error):
+    db = FakeDB(None, error)
+    buffer = make_buffer(db)
+    fill(buffer, 1200)
+
+    with pytest.raises(requests.RequestException):
+        buffer.flush()
+    # Only the unconfirmed 200 are left, the first 1000 went through
+    assert len(buffer) == 200
+
+    buffer.add("CH0", 1050)
+    buffer.flush()
+
+    # The server may have applied the batch already, it must not differ from the first try
+    assert db.batches[2] == db.batches[1] and db.batch_ids[2] == db.batch_ids[1]
+    assert db.batches[3] == {("CH0", 1050): 1}
+    assert len(set(db.batch_ids)) == 3
+    assert len(buffer) == 0
+
+
+def test_new_increments_wait_for_unconfirmed_batches():
+    db = FakeDB(requests.ConnectionError("refused"), requests.ConnectionError("refused"))
+    buffer = make_buffer(db)
+    buffer.add("CH1", 1)
+    with pytest.raises(requests.RequestException):
+        buffer.flush()
+
+    buffer.add("CH1", 1)
+    with pytest.raises(requests.RequestException):
+        buffer.flush()
+
+    # Still merged in memory instead of piling up as separate batches
+    assert buffer._pending == {("CH1", 1): 1}
+    buffer.add("CH1", 1)
+    buffer.flush()
+    assert db.batches[-2:] == [{("CH1", 1): 1}, {("CH1", 1): 2}]
@@ -0,0 +1,32 @@
+from constants import LearningLanguage
+from translation_memory import TranslationMemory, normalize
+
+LANGUAGES = dict(source_lang=LearningLanguage.DE, target_lang=LearningLanguage.EN)
+
+
+def test_normalize_keeps_case():
+    assert normalize("  Café  au   lait ") == "Café au lait"
+    assert normalize("Essen") != normalize("essen")
+
+
+def test_translations_survive_a_restart(tmp_path):
+    path = str(tmp_path / "translations.db")
+    TranslationMemory(path).put_many({"Haus": "house", " Baum ": "tree"}, **LANGUAGES)
+
+    memory = TranslationMemory(path)
+    found = memory.get_many(["Haus", "Baum", "Wolke"], **LANGUAGES)
+
+    assert found == {"Haus": "house", "Baum": "tree"}
+    assert (memory.hits, memory.misses) == (2, 1)
+
+
+def test_translations_are_kept_per_language_pair(tmp_path):
+    memory = TranslationMemory(str(tmp_path / "translations.db"), capacity=1)
+    memory.put_many({"Haus": "house"}, **LANGUAGES)
+    memory.put_many({"Haus": "casa"}, source_lang=LearningLanguage.DE,
+                    target_lang=LearningLanguage.ES)
+
+    # Capacity 1: one of them comes from SQLite
+    assert memory.get_many(["Haus"], **LANGUAGES) == {"Haus": "house"}
+    assert memory.get_many(["Haus"], source_lang=LearningLanguage.DE,
+                           target_lang=LearningLanguage.ES) == {"Haus": "casa"}
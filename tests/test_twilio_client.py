@@ -0,0 +1,231 @@
+import threading
+import time
+
+import requests
+
+from constants import LearningLanguage
+from conversation_partitioner import ConversationPartitioner, LeaseStore
+from offline_twilio import OfflineTwilio
+from outbound_dispatcher import OutboundDispatcher
+from poll_scheduler import PollScheduler
+from twilio_client import TwilioClient
+
+CONVERSATION_SID = "CHpolling"
+LEARNER = "whatsapp:+490000000000"
+
+
+def make_client(twilio: OfflineTwilio, context_store_path: str, handled: list[str],
+                **options) -> TwilioClient:
+    client = TwilioClient(account_sid="ACtest", api_key="SKtest", api_secret="secret",
+                          conversation_service_id="IStest", client=twilio,
+                          context_store_path=context_store_path, **options)
+
+    def handle_message(context):
+        handled.append(context.message)
+        context.send_message(f"echo {context.message}")
+
+    client.on_message(handle_message)
+    client.on_command(lambda context, command: None)
+    return client
+
+
+def test_high_water_mark_survives_a_restart(tmp_path, no_network):
+    twilio = OfflineTwilio()
+    messages = twilio.conversation(CONVERSATION_SID).messages
+    path = str(tmp_path / "contexts.db")
+
+    handled = []
+    client = make_client(twilio, path, handled)
+    messages.create(author=LEARNER, body="hallo")
+    client._poll_once(CONVERSATION_SID, skip_history=False)
+    # Sees only the bot's own reply, the mark moves past it all the same
+    client._poll_once(CONVERSATION_SID, skip_history=False)
+    assert handled == ["hallo"]
+    assert client._contexts.load_record(CONVERSATION_SID).last_message_index == 1
+
+    messages.create(author=LEARNER, body="tschüss")
+    handled = []
+    restarted = make_client(twilio, path, handled)
+    restarted._poll_once(CONVERSATION_SID, skip_history=True)
+
+    # Neither the old messages again nor skipping the one sent while we were down
+    assert handled == ["tschüss"]
+    assert [message.body for message in messages.list()][-1] == "echo tschüss"
+
+
+def test_context_is_handed_over_on_rebalance(tmp_path, no_network):
+    twilio = OfflineTwilio()
+    path = str(tmp_path / "workers.db")
+
+    def partitioner(worker_id: str) -> ConversationPartitioner:
+        return ConversationPartitioner(LeaseStore(path), worker_id, heartbeat_interval=0.05)
+
+    first_partitioner = partitioner("first")
+    first = make_client(twilio, path, [], partitioner=first_partitioner)
+    first.register_conversation(CONVERSATION_SID)
+    assert first._get_owned_conversations() == [CONVERSATION_SID]
+    twilio.conversation(CONVERSATION_SID).messages.create(author=LEARNER, body="hallo")
+    first._poll_once(CONVERSATION_SID, skip_history=False)
+    # Changed outside of a turn, only the live context knows about it
+    first._contexts.get(CONVERSATION_SID).learning_lang = LearningLanguage.EN
+
+    # A second worker that gets the conversation: our test worker ids hash it there
+    second_partitioner = partitioner("second")
+    second_partitioner.start()
+    second = make_client(twilio, path, [], partitioner=second_partitioner)
+    second.register_conversation(CONVERSATION_SID)
+    time.sleep(0.1)
+    try:
+        owned_by_first = first._get_owned_conversations()
+        owned_by_second = second._get_owned_conversations()
+    finally:
+        second_partitioner.leave()
+
+    assert owned_by_first == [] and owned_by_second == [CONVERSATION_SID]
+    handed_over = second._get_conversation_context(CONVERSATION_SID)
+    assert handed_over.learning_lang == LearningLanguage.EN
+    # Past the bot's reply to "hallo"
+    assert handed_over.last_message_index == 1
+
+
+class RecordingScheduler(PollScheduler):
+    def __init__(self):
+        super().__init__()
+        self.reports = []
+
+    def report(self, sid: str, *, active: bool, had_messages: bool, failed: bool = False):
+        self.reports.append(had_messages)
+
+
+def test_own_replies_do_not_count_as_activity(tmp_path, no_network):
+    twilio = OfflineTwilio()
+    scheduler = RecordingScheduler()
+    client = make_client(twilio, str(tmp_path / "contexts.db"), [], scheduler=scheduler)
+
+    twilio.conversation(CONVERSATION_SID).messages.create(author=LEARNER, body="hallo")
+    client._poll_once(CONVERSATION_SID, skip_history=False)
+    # Only finds the echo of the first poll
+    client._poll_once(CONVERSATION_SID, skip_history=False)
+    client._poll_once(CONVERSATION_SID, skip_history=False)
+
+    assert scheduler.reports == [True, False, False]
+
+
+def test_fallback_polls_keep_their_interval():
+    scheduler = PollScheduler(active_interval=60, idle_interval=60, max_idle_interval=60)
+    scheduler.sync([CONVERSATION_SID])
+
+    intervals = []
+    for _ in range(4):
+        sid, _ = scheduler.next_due()
+        scheduler.report(sid, active=False, had_messages=False)
+        intervals.append(scheduler._backoff[sid])
+        # Skip the wait
+        scheduler._schedule(sid, time.monotonic())
+
+    assert intervals == [60, 60, 60, 60]
+
+
+def test_active_conversations_back_off_less_than_idle_ones():
+    scheduler = PollScheduler(active_interval=0.5, idle_interval=3, max_idle_interval=300,
+                              max_active_interval=5, active_window=0)
+    scheduler.sync(["CHactive", "CHidle"])
+
+    intervals = {"CHactive": [], "CHidle": []}
+    for _ in range(8):
+        sid, _ = scheduler.next_due()
+        scheduler.report(sid, active=sid == "CHactive", had_messages=False)
+        intervals[sid].append(scheduler._backoff[sid])
+        scheduler._schedule(sid, time.monotonic())
+
+    assert intervals["CHactive"] == [3, 5, 5, 5]
+    assert intervals["CHidle"] == [3, 6, 12, 24]
+
+
+def test_polling_survives_a_failing_handler(tmp_path, no_network):
+    twilio = OfflineTwilio()
+    scheduler = PollScheduler(active_interval=0.01, idle_interval=0.01, max_idle_interval=0.05)
+    client = make_client(twilio, str(tmp_path / "contexts.db"), [], scheduler=scheduler)
+    handled = []
+
+    def handle_message(context):
+        if context.message == "kaputt":
+            raise requests.exceptions.ReadTimeout("read timed out")
+        handled.append(context.message)
+
+    client.on_message(handle_message)
+    polling = threading.Thread(target=client.start_polling)
+    polling.start()
+    try:
+        # A conversation that starts after the bot, so its first messages are not skipped
+        time.sleep(0.1)
+        messages = twilio.conversation(CONVERSATION_SID).messages
+        messages.create(author=LEARNER, body="kaputt")
+        messages.create(author=LEARNER, body="hallo")
+        client.register_conversation(CONVERSATION_SID)
+        deadline = time.monotonic() + 5
+        while not handled and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        client.stop_polling()
+        polling.join(5)
+
+    # The failing message is not retried, the one after it is handled
+    assert handled == ["hallo"]
+    assert not polling.is_alive()
+
+
+def test_failing_polls_back_off():
+    scheduler = PollScheduler(active_interval=0.5, idle_interval=3, max_idle_interval=300)
+    scheduler.sync([CONVERSATION_SID])
+
+    intervals = []
+    for _ in range(3):
+        sid, _ = scheduler.next_due()
+        scheduler.report(sid, active=True, had_messages=False, failed=True)
+        intervals.append(scheduler._backoff[sid])
+        scheduler._schedule(sid, time.monotonic())
+
+    assert intervals == [3, 6, 12]
+
+
+def ingest(client: TwilioClient, message):
+    client.ingest_message(CONVERSATION_SID, message_sid=message.sid, index=message.index,
+                          author=message.author, body=message.body)
+
+
+def test_webhook_after_a_reply_is_dispatched_without_fetching(tmp_path, no_network, monkeypatch):
+    twilio = OfflineTwilio()
+    messages = twilio.conversation(CONVERSATION_SID).messages
+    outbound = OutboundDispatcher(TwilioClient.SYS_USERNAME)
+    handled = []
+    client = make_client(twilio, str(tmp_path / "contexts.db"), handled, outbound=outbound)
+    fetches = []
+    monkeypatch.setattr(client, "_fetch_new_messages", lambda context: fetches.append(context))
+
+    outbound.start()
+    ingest(client, messages.create(author=LEARNER, body="hallo"))
+    # Wait until the reply has taken its index
+    outbound.stop()
+    ingest(client, messages.create(author=LEARNER, body="noch da?"))
+
+    assert handled == ["hallo", "noch da?"]
+    assert fetches == []
+
+
+def test_first_webhook_keeps_the_resume_index(tmp_path, no_network):
+    twilio = OfflineTwilio()
+    messages = twilio.conversation(CONVERSATION_SID).messages
+    path = str(tmp_path / "workers.db")
+    partitioner = ConversationPartitioner(LeaseStore(path), "first", heartbeat_interval=0.05)
+    assert partitioner.owns(CONVERSATION_SID)
+    # A previous owner handled the first two messages
+    for body in ["eins", "zwei", "drei", "vier"]:
+        message = messages.create(author=LEARNER, body=body)
+    partitioner.record_progress(CONVERSATION_SID, 1)
+
+    handled = []
+    client = make_client(twilio, path, handled, partitioner=partitioner)
+    ingest(client, message)
+
+    assert handled == ["drei", "vier"]
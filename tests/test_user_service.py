@@ -0,0 +1,79 @@
+import threading
+import time
+
+from constants import ConversationStatus, LearningLanguage, LearningLevel
+from offline_twilio import OfflineConversation
+from twilio_client import ConversationContext
+from user_service import UserService
+import user_messages
+
+
+class FakeDB:
+    def __init__(self, words: int = 0):
+        self.words = words
+        self.users = []
+
+    def get_user(self, sid):
+        return None
+
+    def has_word(self, lang, level) -> bool:
+        return self.words > 0
+
+    def create_user(self, sid, level, to_lang, from_lang):
+        self.users.append(sid)
+
+
+class SlowGenerator:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def fill(self, lang, level, size, job):
+        self.release.wait(5)
+        job.report(5)
+
+
+def select_level(service: UserService, handled: list) -> ConversationContext:
+    context = ConversationContext("CHonboarding", OfflineConversation("CHonboarding", echo=False))
+    context.status = ConversationStatus.SELECT_LEVEL
+    context.learning_lang = LearningLanguage.EN
+    context.message = "EASY"
+
+    context.begin_turn()
+    service.authenticate_user(context, handled.append)
+    context.end_turn()
+    return context
+
+
+def sent(context: ConversationContext) -> list[str]:
+    return [message.body for message in context.conversation.messages.list()]
+
+
+def test_onboarding_does_not_wait_for_word_generation():
+    generator = SlowGenerator()
+    service = UserService(None, None, FakeDB(), generator=generator)
+    handled = []
+
+    start = time.monotonic()
+    context = select_level(service, handled)
+
+    assert time.monotonic() - start < 1
+    assert handled == []
+    assert sent(context) == [user_messages.WORDS_NOT_READY]
+
+    generator.release.set()
+    deadline = time.monotonic() + 5
+    while len(sent(context)) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sent(context) == [user_messages.WORDS_NOT_READY, user_messages.WORDS_READY]
+
+
+def test_game_starts_right_away_when_the_deck_has_words():
+    generator = SlowGenerator()
+    generator.release.set()
+    service = UserService(None, None, FakeDB(words=10), generator=generator)
+    handled = []
+
+    context = select_level(service, handled)
+
+    assert handled == [context]
+    assert context.status == ConversationStatus.AUTHENTICATED
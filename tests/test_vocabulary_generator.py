@@ -0,0 +1,96 @@
+from constants import LearningLanguage, LearningLevel
+from vocabulary_generator import VocabularyGenerator
+
+
+class FakeDB:
+    def __init__(self, known_words: list[str]):
+        self._known_words = known_words
+        self.stored: dict[str, str] = {}
+
+    def word_count(self, lang, level) -> int:
+        return len(self.stored)
+
+    def known_words(self, lang, level) -> list[str]:
+        return list(self._known_words)
+
+    def create_words(self, words: dict[str, str], lang, level):
+        self.stored.update(words)
+
+
+class FakeLLM:
+    def __init__(self, replies: list[list[str]]):
+        self.excluded = []
+        self.use_cache = []
+        self._replies = replies
+
+    def stream_words(self, language_native, language_to_learn, language_level,
+                     number_of_words, exclude=None, use_cache=True):
+        self.excluded.append(list(exclude))
+        self.use_cache.append(use_cache)
+        yield from self._replies.pop(0) if self._replies else []
+
+
+class FakeDeepL:
+    def translate_texts(self, texts: list[str], target_lang) -> list[str]:
+        return [f"{text} [{target_lang.code()}]" for text in texts]
+
+
+def make_generator(llm: FakeLLM, db: FakeDB) -> VocabularyGenerator:
+    return VocabularyGenerator(llm, FakeDeepL(), db, store_batch_size=2)
+
+
+def test_known_words_are_excluded_in_storage_order():
+    # Word id order from the API, not alphabetical
+    db = FakeDB(["Zebra", "Apfel", "Mond"])
+    llm = FakeLLM([["Baum", "Haus"]])
+
+    make_generator(llm, db).fill(LearningLanguage.EN, LearningLevel.EASY, 2)
+
+    assert llm.excluded[0] == ["Zebra", "Apfel", "Mond"]
+
+
+def test_duplicates_are_compared_normalized_with_case_kept():
+    db = FakeDB(["Essen"])
+    llm = FakeLLM([["essen", "Essen", " Haus ", "Haus", "Café", "Café"]])
+
+    make_generator(llm, db).fill(LearningLanguage.EN, LearningLevel.EASY, 3)
+
+    assert sorted(db.stored) == ["Caf\u00e9", "Haus", "essen"]
+
+
+def test_later_rounds_exclude_what_was_generated_before():
+    db = FakeDB([])
+    llm = FakeLLM([["Baum"], ["Haus"]])
+
+    make_generator(llm, db).fill(LearningLanguage.EN, LearningLevel.EASY, 2)
+
+    assert llm.excluded == [[], ["Baum"]]
+    assert db.stored == {"Baum": "Baum [EN]", "Haus": "Haus [EN]"}
+
+
+def test_rounds_after_duplicates_bypass_the_response_cache():
+    db = FakeDB(["Baum"])
+    llm = FakeLLM([["Baum"], ["Baum"], ["Haus"]])
+
+    make_generator(llm, db).fill(LearningLanguage.EN, LearningLevel.EASY, 1)
+
+    # The second round has the same prompt as the first, only a fresh reply can help
+    assert llm.excluded[0] == llm.excluded[1]
+    assert llm.use_cache == [True, False, False]
+    assert db.stored == {"Haus": "Haus [EN]"}
+
+
+class BrokenStreamLLM(FakeLLM):
+    def stream_words(self, *args, **kwargs):
+        yield from super().stream_words(*args, **kwargs)
+        raise ConnectionError("stream broke off")
+
+
+def test_words_streamed_before_an_error_are_stored():
+    db = FakeDB([])
+    llm = BrokenStreamLLM([["Baum", "Haus", "Wolke"]])
+
+    make_generator(llm, db).fill(LearningLanguage.EN, LearningLevel.EASY, 3)
+
+    # A full batch of two and the partial batch left when the stream broke
+    assert db.stored == {"Baum": "Baum [EN]", "Haus": "Haus [EN]", "Wolke": "Wolke [EN]"}
@@ -0,0 +1,67 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from offline_twilio import OfflineTwilio
+from twilio_client import TwilioClient
+from twilio_webhook import create_webhook_app, WEBHOOK_PATH
+from webhook_replayer import replay
+
+AUTH_TOKEN = "test-token"
+URL = f"http://testserver{WEBHOOK_PATH}"
+CONVERSATION_SID = "CHreplay"
+
+
+def make_client(twilio: OfflineTwilio) -> TwilioClient:
+    client = TwilioClient(account_sid="ACtest", api_key="SKtest", api_secret="secret",
+                          conversation_service_id="IStest", client=twilio)
+    client.on_message(lambda context: context.send_message(f"echo {context.message}"))
+    client.on_command(lambda context, command: context.send_message(f"command {command}"))
+    return client
+
+
+def replies(twilio: OfflineTwilio) -> list[str]:
+    return [message.body for message in twilio.conversation(CONVERSATION_SID).messages.list()
+            if message.author == TwilioClient.SYS_USERNAME]
+
+
+def test_replayed_webhooks_are_answered_offline(no_network):
+    twilio = OfflineTwilio()
+    app = create_webhook_app(make_client(twilio), auth_token=AUTH_TOKEN, public_url=URL)
+
+    with TestClient(app) as session:
+        replay(URL, AUTH_TOKEN, CONVERSATION_SID, "whatsapp:+490000000000",
+               ["!start", "EN", "EASY"], session=session)
+
+    assert replies(twilio) == ["command start", "echo EN", "echo EASY"]
+
+
+def test_replayed_webhook_is_not_dispatched_twice(no_network):
+    twilio = OfflineTwilio()
+    app = create_webhook_app(make_client(twilio), auth_token=AUTH_TOKEN, public_url=URL)
+
+    with TestClient(app) as session:
+        replay(URL, AUTH_TOKEN, CONVERSATION_SID, "whatsapp:+490000000000", ["hallo"],
+               session=session)
+        replay(URL, AUTH_TOKEN, CONVERSATION_SID, "whatsapp:+490000000000", ["hallo"],
+               session=session)
+
+    assert replies(twilio) == ["echo hallo"]
+
+
+def test_unsigned_webhook_is_rejected(no_network):
+    twilio = OfflineTwilio()
+    app = create_webhook_app(make_client(twilio), auth_token=AUTH_TOKEN, public_url=URL)
+
+    with TestClient(app) as session:
+        response = session.post(URL, data={"EventType": "onMessageAdded",
+                                           "ConversationSid": CONVERSATION_SID,
+                                           "Index": "0", "Body": "hallo"})
+
+    assert response.status_code == 403
+    assert replies(twilio) == []
+
+
+@pytest.mark.parametrize("auth_token", [None, ""])
+def test_missing_auth_token_fails_at_startup(auth_token):
+    with pytest.raises(ValueError, match="TWILIO_AUTH_TOKEN"):
+        create_webhook_app(make_client(OfflineTwilio()), auth_token=auth_token)
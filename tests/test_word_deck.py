@@ -0,0 +1,55 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from constants import LearningLanguage, LearningLevel
+from word_deck import WordDeckPool
+
+
+class FakeDB:
+    def __init__(self, words: int = 100, latency: float = 0.0):
+        self.calls = []
+        self._words = [{"word_id": i, "de": f"Wort {i}", "translation": f"word {i}"}
+                       for i in range(words)]
+        self._latency = latency
+        self._lock = threading.Lock()
+
+    def get_words(self, lang, level, count=1):
+        with self._lock:
+            self.calls.append(count)
+        time.sleep(self._latency)
+        return self._words[:count]
+
+
+def test_cold_deck_is_filled_with_one_request():
+    db = FakeDB(latency=0.05)
+    pool = WordDeckPool(db, batch_size=20, low_water_mark=5)
+
+    with ThreadPoolExecutor(max_workers=8) as learners:
+        words = list(learners.map(
+            lambda _: pool.next_word(LearningLanguage.EN, LearningLevel.EASY), range(8)
+        ))
+
+    assert db.calls == [20]
+    assert len({word["word_id"] for word in words}) == 8
+
+
+def test_deck_refills_in_the_background_below_the_low_water_mark():
+    db = FakeDB()
+    pool = WordDeckPool(db, batch_size=10, low_water_mark=5)
+    deck = pool.get_deck(LearningLanguage.EN, LearningLevel.EASY)
+
+    for _ in range(6):
+        deck.next_word()
+    time.sleep(0.05)
+
+    assert db.calls == [10, 10]
+
+
+def test_empty_vocabulary_raises_lookup_error():
+    pool = WordDeckPool(FakeDB(words=0), batch_size=10, low_water_mark=5)
+
+    with pytest.raises(LookupError):
+        pool.next_word(LearningLanguage.EN, LearningLevel.EASY)
@@ -0,0 +1,42 @@
+from app.word_index import WordSamplingIndex
+
+
+def make_index() -> WordSamplingIndex:
+    index = WordSamplingIndex()
+    index.load([
+        (1, "easy", "Haus", "en", "house"),
+        (1, "easy", "Haus", "es", "casa"),
+        (2, "EASY", "Baum", "en", "tree"),
+        (3, "hard", "Zebra", None, None),
+        (4, "hard", "Wolke", "en", " "),
+    ])
+    return index
+
+
+def test_words_are_indexed_per_language_and_level():
+    index = make_index()
+
+    assert index.coverage() == {("en", "easy"): 2, ("es", "easy"): 1}
+    assert index.count("en", "EASY") == 2
+    assert index.count("en", "hard") == 0
+
+
+def test_sample_returns_distinct_words():
+    index = make_index()
+
+    words = index.sample("en", "easy", count=10)
+
+    assert sorted(word["word_id"] for word in words) == [1, 2]
+    assert index.sample("es") == [{"word_id": 1, "de": "Haus", "translation": "casa"}]
+    assert index.sample("ru") == []
+
+
+def test_upsert_and_remove_keep_the_index_consistent():
+    index = make_index()
+
+    index.upsert(2, "hard", "Baum", {"en": "tree", "es": "árbol"})
+    index.remove(1)
+
+    assert index.coverage() == {("en", "hard"): 1, ("es", "hard"): 1}
+    assert index.sample("en", "easy") == []
+    assert index.sample("es", "hard")[0]["translation"] == "árbol"
@@ -0,0 +1,89 @@
+import threading
+import unicodedata
+
+from constants import LearningLanguage
+from metrics import EVENTS
+from sqlite_connection import SharedConnection
+from ttl_cache import TTLCache, MISSING
+
+
+def normalize(text: str) -> str:
+    # Case is kept, "Essen" and "essen" translate differently
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class TranslationMemory:
+    """
+    Translations we already paid for, keyed by (source language, target language, normalized
+    text). Persisted in SQLite with an in-memory LRU in front.
+    """
+    CAPACITY = 10_000
+    # Stay below SQLite's limit of host parameters per statement
+    QUERY_CHUNK_SIZE = 500
+
+    def __init__(self, path: str, *, capacity: int = CAPACITY):
+        self._cache = TTLCache(maxsize=capacity, ttl=None)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._db = SharedConnection(path, """
+            CREATE TABLE IF NOT EXISTS translation_memory (
+                source_lang TEXT NOT NULL,
+                target_lang TEXT NOT NULL,
+                text TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                PRIMARY KEY (source_lang, target_lang, text)
+            ) WITHOUT ROWID
+        """)
+
+    def get_many(self, texts: list[str], *, source_lang: LearningLanguage,
+                 target_lang: LearningLanguage) -> dict[str, str]:
+        """Normalized text -> translation for every text that is known"""
+        languages = (source_lang.code(), target_lang.code())
+        texts = list(dict.fromkeys(map(normalize, texts)))
+        found = {}
+        missing = []
+        for text in texts:
+            translation = self._cache.get(languages + (text,))
+            if translation is MISSING:
+                missing.append(text)
+            else:
+                found[text] = translation
+
+        for start in range(0, len(missing), TranslationMemory.QUERY_CHUNK_SIZE):
+            chunk = missing[start:start + TranslationMemory.QUERY_CHUNK_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self._db.query(
+                "SELECT text, translation FROM translation_memory "
+                f"WHERE source_lang = ? AND target_lang = ? AND text IN ({placeholders})",
+                languages + tuple(chunk)
+            )
+            for text, translation in rows:
+                self._cache.set(languages + (text,), translation)
+                found[text] = translation
+
+        self._record(hits=len(found), misses=len(texts) - len(found))
+        return found
+
+    def put_many(self, translations: dict[str, str], *, source_lang: LearningLanguage,
+                 target_lang: LearningLanguage):
+        languages = (source_lang.code(), target_lang.code())
+        rows = [languages + (normalize(text), translation)
+                for text, translation in translations.items()]
+        self._db.executemany(
+            "INSERT OR REPLACE INTO translation_memory VALUES (?, ?, ?, ?)", rows
+        )
+        for row in rows:
+            self._cache.set(row[:3], row[3])
+
+    def _record(self, hits: int, misses: int):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        EVENTS.inc(hits, event="translation_memory_hit")
+        EVENTS.inc(misses, event="translation_memory_miss")
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
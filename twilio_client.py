@@ -1,34 +1,79 @@
+import threading
 import time
 from collections.abc import Callable
-from enum import Enum
-from datetime import datetime, timezone
 from twilio.rest import Client
-from twilio.rest.conversations.v1.service.conversation import ConversationInstance
+from twilio.rest.conversations.v1.service.conversation import (
+    ConversationContext as TwilioConversation
+)
+from twilio.rest.conversations.v1.service.conversation.message import MessageInstance
 
-from constants import LearningLanguage, LearningLevel
-
-
-class ConversationStatus(Enum):
-    UNKNOWN = 0
-    UNAUTHENTICATED = 1
-    AUTHENTICATED = 2
-    SELECT_LANG = 3
-    SELECT_LEVEL = 4
-    INACTIVE = 5
+from constants import LearningLanguage, LearningLevel, ConversationStatus
+from conversation_partitioner import ConversationPartitioner
+from conversation_registry import ConversationRegistry
+from context_store import ConversationContextStore
+from outbound_dispatcher import OutboundDispatcher
+from poll_scheduler import PollScheduler
+from metrics import timed, EVENTS, STAGE_ERRORS
 
 
 class ConversationContext:
-    def __init__(self, conversation: ConversationInstance):
-        self.sid: str = conversation.sid
-        self.conversation: ConversationInstance = conversation
+    def __init__(self, sid: str, conversation: TwilioConversation,
+                 outbound: OutboundDispatcher | None = None):
+        self.sid: str = sid
+        self.conversation: TwilioConversation = conversation
         self.status = ConversationStatus.UNKNOWN
         self.learning_lang: LearningLanguage | None = None
         self.learning_level: LearningLevel | None = None
         self.message: str | None = None
         self.current_exercise: dict | None = None
+        # Index of the last message that was processed (high-water mark)
+        self.last_message_index: int | None = None
+        self._outbound = outbound
+        self._pending_messages: list[str] | None = None
+        # Senders advance the mark with the index of our replies
+        self._index_lock = threading.Lock()
 
+    @timed("conversation.send_message")
     def send_message(self, text: str):
-        self.conversation.messages.create(author=TwilioClient.SYS_USERNAME, body=text)
+        if self._pending_messages is not None:
+            self._pending_messages.append(text)
+        else:
+            self._deliver(text)
+
+    def push_message(self, text: str):
+        """Send from outside a turn, e.g. from a background job, never batched into a reply"""
+        self._deliver(text)
+
+    def begin_turn(self):
+        self._pending_messages = []
+
+    def end_turn(self):
+        """Send everything the handler produced during this turn as one message"""
+        pending_messages, self._pending_messages = self._pending_messages, None
+        if pending_messages:
+            self._deliver("\n\n".join(pending_messages))
+
+    def advance(self, index: int):
+        """Move the high-water mark to index, never backwards"""
+        with self._index_lock:
+            self.last_message_index = max(self.last_message_index, index)
+
+    @timed("twilio.deliver")
+    def _deliver(self, text: str):
+        if self._outbound:
+            self._outbound.send(self.conversation, text, on_sent=self._on_sent)
+        else:
+            self._on_sent(
+                self.conversation.messages.create(author=TwilioClient.SYS_USERNAME, body=text)
+            )
+
+    def _on_sent(self, message: MessageInstance):
+        # Our reply takes an index but fires no webhook, skip it so the learner's next
+        # message follows the mark. Only right behind it, anything older is still unseen.
+        with self._index_lock:
+            if (self.last_message_index is not None
+                    and message.index == self.last_message_index + 1):
+                self.last_message_index = message.index
 
     def transition_status(self, *, to: ConversationStatus):
         self.status = to
@@ -46,19 +91,49 @@ class ConversationContext:
         playing_states = [ConversationStatus.AUTHENTICATED]
         return self.status in playing_states
 
+    def is_active(self):
+        return self.is_authenticating() or self.is_playing()
+
+
+class WebhookMessage:
+    def __init__(self, sid: str | None, index: int, author: str | None, body: str | None):
+        self.sid = sid
+        self.index = index
+        self.author = author
+        self.body = body
+
 
 class TwilioClient:
     SYS_USERNAME = "ms-hackathons"
-    POLL_INTERVAL = 3
+    PAGE_SIZE = 50
+    # How often the scheduler learns about new or handed over conversations
+    SYNC_INTERVAL = 1
 
     def __init__(self, *, account_sid: str, api_key: str, api_secret: str,
-                 conversation_service_id: str):
+                 conversation_service_id: str, partitioner: ConversationPartitioner | None = None,
+                 outbound: OutboundDispatcher | None = None,
+                 discovery_interval: float = ConversationRegistry.REFRESH_INTERVAL,
+                 scheduler: PollScheduler | None = None,
+                 context_store_path: str = ":memory:",
+                 context_capacity: int = ConversationContextStore.CAPACITY,
+                 client: Client | None = None):
         self._conversation_service_id: str = conversation_service_id
-        self._client: Client = Client(api_key, api_secret, account_sid)
+        self._partitioner = partitioner
+        self._outbound = outbound
+        # Tests and dry runs pass an OfflineTwilio, nothing is sent to Twilio then
+        self._client: Client = client or Client(api_key, api_secret, account_sid)
+        self._registry = ConversationRegistry(
+            self._list_conversations, refresh_interval=discovery_interval
+        )
+        self._scheduler = scheduler or PollScheduler()
         self._message_handler: Callable[[ConversationContext], None] | None = None
         self._command_handler: Callable[[ConversationContext, str], None] | None = None
-        self._interrupt: bool = False
-        self._conversation_contexts: dict[str, ConversationContext] = {}
+        self._interrupt = threading.Event()
+        self._contexts = ConversationContextStore(
+            context_store_path, self._new_conversation_context, capacity=context_capacity
+        )
+        # Serializes polling and webhook ingestion so high-water marks stay consistent
+        self._dispatch_lock = threading.Lock()
 
     def start_polling(self):
         if not self._message_handler or not self._command_handler:
@@ -66,42 +141,71 @@ class TwilioClient:
                 "Message handler & command handler must be defined before start polling"
             )
 
-        print(f"Started polling new messages every {TwilioClient.POLL_INTERVAL} seconds...")
-        last_poll = datetime.now(tz=timezone.utc).replace(microsecond=0) # TODO: Time server
+        self._registry.refresh()
+        self._registry.start()
+        # Conversations known at startup only get messages sent from now on
+        known_at_startup = set(self._registry.sids())
+        print("Started polling new messages...")
+        last_sync = float("-inf")
 
-        while not self._interrupt:
-            for conversation in self.__get_conversations():
-                if conversation.sid not in self._conversation_contexts:
-                    self.__create_conversation_context(conversation)
+        while not self._interrupt.is_set():
+            if time.monotonic() - last_sync >= TwilioClient.SYNC_INTERVAL:
+                try:
+                    self._scheduler.sync(self._get_owned_conversations())
+                except Exception as e:
+                    print(f"Error syncing conversations: {e}")
+                last_sync = time.monotonic()
 
-                messages = conversation.messages.list()
-                user_messages = [message for message in messages if
-                                 message.author != TwilioClient.SYS_USERNAME]
+            sid, wait = self._scheduler.next_due()
+            if sid is None:
+                self._interrupt.wait(min(wait, TwilioClient.SYNC_INTERVAL))
+                continue
 
-                for message in user_messages:
-                    if message.date_created >= last_poll:
-                        message_text = message.body
+            self._poll_once(sid, skip_history=sid in known_at_startup)
 
-                        if not message_text:
-                            continue
+        self._registry.stop()
+        print("Stopped polling")
 
-                        conversation_context = self._conversation_contexts[conversation.sid]
-                        conversation_context.message = message_text
+    def stop_polling(self):
+        # TODO: maybe update conversation states
+        self._interrupt.set()
 
-                        if message_text.startswith("!"):
-                            self._command_handler(conversation_context, message_text[1:])
-                        else:
-                            self._message_handler(conversation_context)
+    def ingest_message(self, conversation_sid: str, *, message_sid: str | None, index: int,
+                       author: str | None, body: str | None):
+        """Handle a message pushed by an onMessageAdded webhook"""
+        if self._partitioner and not self._partitioner.owns(conversation_sid):
+            # The owning worker picks it up with its next poll
+            return
 
-            last_poll = datetime.now(tz=timezone.utc).replace(microsecond=0) # TODO: Time server
-            time.sleep(TwilioClient.POLL_INTERVAL)
+        self._scheduler.touch(conversation_sid)
 
-        print(f"Stopped polling")
+        with self._dispatch_lock:
+            conversation_context = self._contexts.get(conversation_sid)
+            if not conversation_context:
+                self._registry.add(conversation_sid)
+                conversation_context = self._create_conversation_context(
+                    conversation_sid, first_index=index
+                )
 
-    def stop_polling(self):
-        # TODO: make polling async to make this work
-        # TODO: maybe update conversation states
-        self._interrupt = True
+            if index <= conversation_context.last_message_index:
+                # Redelivered webhook or already polled
+                return
+
+            if index == conversation_context.last_message_index + 1:
+                self._dispatch(conversation_context, WebhookMessage(message_sid, index, author, body))
+                return
+
+            # Webhooks arrived out of order or got lost, let Twilio fill the gap. Our own
+            # replies advance the mark, so this doesn't happen for every answer.
+            for message in self._fetch_new_messages(conversation_context):
+                self._dispatch(conversation_context, message)
+
+    def register_conversation(self, conversation_sid: str):
+        self._registry.add(conversation_sid)
+
+    def forget_conversation(self, conversation_sid: str):
+        self._registry.remove(conversation_sid)
+        self._contexts.forget(conversation_sid)
 
     def on_message(self, message_handler: Callable[[ConversationContext], None]):
         self._message_handler = message_handler
@@ -109,12 +213,148 @@ class TwilioClient:
     def on_command(self, command_handler: Callable[[ConversationContext, str], None]):
         self._command_handler = command_handler
 
-    def __create_conversation_context(self, conversation: ConversationInstance):
-        sid = conversation.sid
-        self._conversation_contexts[sid] = ConversationContext(conversation)
+    @timed("twilio.poll")
+    def _poll_once(self, sid: str, *, skip_history: bool):
+        messages = []
+        conversation_context = None
+        failed = False
+
+        try:
+            with self._dispatch_lock:
+                conversation_context = self._get_conversation_context(
+                    sid, skip_history=skip_history
+                )
+                messages = self._fetch_new_messages(conversation_context)
+                for message in messages:
+                    self._dispatch(conversation_context, message)
+        except Exception as e:
+            # One conversation (or a timeout) must not end polling for all of them. The
+            # failing message is behind the high-water mark already and is not retried.
+            failed = True
+            STAGE_ERRORS.inc(stage="twilio.poll")
+            print(f"Error polling {sid}: {e}")
+        finally:
+            active = conversation_context is not None and conversation_context.is_active()
+            self._scheduler.report(sid, active=active, failed=failed,
+                                   had_messages=self._has_inbound(messages))
+
+    @staticmethod
+    def _has_inbound(messages: list[MessageInstance]) -> bool:
+        # Our own replies are no sign of a learner being around
+        return any(message.author != TwilioClient.SYS_USERNAME for message in messages)
+
+    def _get_conversation_context(self, sid: str, *,
+                                  skip_history: bool = False) -> ConversationContext:
+        """The live or rehydrated context, a new one for conversations never seen before"""
+        conversation_context = self._contexts.get(sid)
+        if conversation_context:
+            return conversation_context
+        return self._create_conversation_context(sid, skip_history=skip_history)
+
+    def _new_conversation_context(self, sid: str) -> ConversationContext:
+        conversation = self._get_service().conversations(sid)
+        return ConversationContext(sid, conversation, self._outbound)
+
+    def _create_conversation_context(self, sid: str, *, skip_history: bool = False,
+                                     first_index: int | None = None) -> ConversationContext:
+        conversation_context = self._new_conversation_context(sid)
+        resume_index = self._partitioner.resume_index(sid) if self._partitioner else None
+
+        if resume_index is not None:
+            # Taken over from another worker, continue where it stopped
+            conversation_context.last_message_index = resume_index
+        elif first_index is not None:
+            # A webhook is the first thing we see of this conversation
+            conversation_context.last_message_index = first_index - 1
+        elif skip_history:
+            latest = conversation_context.conversation.messages.list(order="desc", limit=1)
+            conversation_context.last_message_index = latest[0].index if latest else -1
+        else:
+            conversation_context.last_message_index = -1
+
+        self._contexts.add(conversation_context)
+        return conversation_context
+
+    @timed("twilio.fetch_messages")
+    def _fetch_new_messages(self, conversation_context: ConversationContext) -> list[MessageInstance]:
+        """Read messages newest first until the high-water mark and return them oldest first"""
+        new_messages = []
+        messages = conversation_context.conversation.messages.stream(
+            order="desc", page_size=TwilioClient.PAGE_SIZE
+        )
+
+        for message in messages:
+            if message.index <= conversation_context.last_message_index:
+                break
+            new_messages.append(message)
+
+        new_messages.reverse()
+        return new_messages
+
+    def _dispatch(self, conversation_context: ConversationContext,
+                  message: "MessageInstance | WebhookMessage"):
+        # Never move backwards, messages may be queued ahead of their dispatch
+        conversation_context.advance(message.index)
+        try:
+            self._handle_message(conversation_context, message)
+        finally:
+            # Persist the high-water mark for every message, not only for answered ones,
+            # so a restart doesn't read the bot's own replies again
+            self._contexts.save(conversation_context)
+
+    def _handle_message(self, conversation_context: ConversationContext,
+                        message: "MessageInstance | WebhookMessage"):
+        message_text = message.body
+
+        if self._partitioner:
+            self._partitioner.record_progress(conversation_context.sid, message.index)
+            if message.sid and not self._partitioner.claim_message(message.sid):
+                return
+
+        if message.author == TwilioClient.SYS_USERNAME or not message_text:
+            return
+
+        EVENTS.inc(event="message_received")
+
+        conversation_context.message = message_text
+        conversation_context.begin_turn()
+
+        try:
+            if message_text.startswith("!"):
+                self._command_handler(conversation_context, message_text[1:])
+            else:
+                self._message_handler(conversation_context)
+        finally:
+            conversation_context.end_turn()
+
+    def _get_owned_conversations(self) -> list[str]:
+        sids = self._registry.sids()
+        if not self._partitioner:
+            return sids
+
+        self._partitioner.refresh()
+        owned_sids = []
+
+        for sid in sids:
+            if self._partitioner.owns(sid):
+                owned_sids.append(sid)
+            else:
+                self._hand_over(sid)
+
+        return owned_sids
+
+    def _hand_over(self, sid: str):
+        """Owned by another worker now, which continues from the shared context store"""
+        with self._dispatch_lock:
+            conversation_context = self._contexts.forget(sid)
+            if conversation_context:
+                # Whatever changed since the last turn must not be lost with the live context
+                self._contexts.save(conversation_context)
 
-    def __get_conversations(self):
-        return self.__get_service().conversations.list()
+    def _list_conversations(self, **filters):
+        return self._get_service().conversations.stream(
+            page_size=TwilioClient.PAGE_SIZE, **filters
+        )
 
-    def __get_service(self):
+    def _get_service(self):
         return self._client.conversations.v1.services(self._conversation_service_id)
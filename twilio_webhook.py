@@ -0,0 +1,56 @@
+from fastapi import FastAPI, Request, Response, HTTPException, BackgroundTasks
+from fastapi.responses import PlainTextResponse
+from twilio.request_validator import RequestValidator
+
+import metrics
+from twilio_client import TwilioClient
+
+WEBHOOK_PATH = "/twilio/conversations"
+
+
+def create_webhook_app(twilio_client: TwilioClient, *, auth_token: str,
+                       public_url: str | None = None) -> FastAPI:
+    """
+    ASGI app receiving Twilio Conversations post-event webhooks.
+    public_url must be set when running behind a proxy, because Twilio signs the URL it calls.
+    """
+    if not auth_token:
+        # Every signature check would fail, each webhook would be answered with an error
+        raise ValueError("TWILIO_AUTH_TOKEN not found in .env file.")
+
+    app = FastAPI()
+    validator = RequestValidator(auth_token)
+
+    @app.post(WEBHOOK_PATH)
+    async def conversations_webhook(request: Request, background_tasks: BackgroundTasks):
+        params = dict(await request.form())
+        url = public_url or str(request.url)
+        signature = request.headers.get("X-Twilio-Signature", "")
+
+        if not validator.validate(url, params, signature):
+            raise HTTPException(status_code=403, detail="Invalid Twilio signature")
+
+        event_type = params.get("EventType")
+
+        if event_type == "onConversationAdded":
+            twilio_client.register_conversation(params["ConversationSid"])
+        elif event_type == "onConversationRemoved":
+            twilio_client.forget_conversation(params["ConversationSid"])
+        elif event_type == "onMessageAdded":
+            # Answer Twilio right away, handlers may take a while (e.g. word generation)
+            background_tasks.add_task(
+                twilio_client.ingest_message,
+                params["ConversationSid"],
+                message_sid=params.get("MessageSid"),
+                index=int(params["Index"]),
+                author=params.get("Author"),
+                body=params.get("Body"),
+            )
+
+        return Response(status_code=200)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def prometheus_metrics():
+        return metrics.render_prometheus()
+
+    return app
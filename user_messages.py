@@ -34,4 +34,8 @@ WELCOME_MESSAGE = "👋 Willkommen bei MemoMate! Los geht’s mit deiner Sprache
 
 STOP_MESSAGE = "👋 Session beendet. Viel Erfolg beim Weiterlernen!"
 
-UNKNOWN = "❓Unbekannte Nachricht. Schreib 'help' für eine Liste aller Befehle."
\ No newline at end of file
+UNKNOWN = "❓Unbekannte Nachricht. Schreib 'help' für eine Liste aller Befehle."
+
+WORDS_NOT_READY = "⏳ Deine Vokabeln werden gerade vorbereitet. Schreib mir gleich nochmal!"
+
+WORDS_READY = "✅ Deine Vokabeln sind bereit! Schreib mir etwas, um loszulegen."
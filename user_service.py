@@ -3,15 +3,25 @@ from collections.abc import Callable
 from constants import LearningLevel, LearningLanguage
 from db_client import DBClient
 from deepl_client import DeepLClient
+from generation_jobs import GenerationJob, GenerationJobQueue
 from gpt4o_mini_client import GPT4oMiniClient
 from twilio_client import ConversationStatus, ConversationContext
+from vocabulary_generator import VocabularyGenerator
+import user_messages
 
 
 class UserService:
-    def __init__(self, llm: GPT4oMiniClient, deepl: DeepLClient, db: DBClient):
+    # Generate words until a language and level has at least this many
+    MIN_WORDS = 10
+
+    def __init__(self, llm: GPT4oMiniClient, deepl: DeepLClient, db: DBClient,
+                 jobs: GenerationJobQueue | None = None,
+                 generator: VocabularyGenerator | None = None):
         self._llm = llm
         self._deepl = deepl
         self._db = db
+        self._generator = generator or VocabularyGenerator(llm, deepl, db)
+        self._jobs = jobs or GenerationJobQueue(self._generate_words)
 
     def create_user(self, sid: str, level: LearningLevel, to_lang: LearningLanguage,
                     from_lang: LearningLanguage = LearningLanguage.DE):
@@ -20,18 +30,12 @@ class UserService:
         print("LEVEL", level)
         print("TO LANG", to_lang)
 
-    def generate_words(self, level: LearningLevel, to_lang: LearningLanguage):
-        if not self._db.has_word(to_lang, level):
-            answer = self._llm.chat(LearningLanguage.DE, to_lang, level, 10)
-            words = self._llm.string_to_dict(answer)
-            print(words)
-            translated_words = self._deepl.translate_dict(words, target_lang=to_lang)
-            print(translated_words)
+    def generate_words(self, level: LearningLevel, to_lang: LearningLanguage) -> GenerationJob:
+        """Generate missing words in the background, joining a running job for the same deck"""
+        return self._jobs.submit(to_lang, level)
 
-            for i in words:
-                from_word = words.get(i)
-                to_word = translated_words.get(i)
-                self._db.create_word(from_word, to_word, to_lang, level)
+    def _generate_words(self, job: GenerationJob):
+        self._generator.fill(job.lang, job.level, UserService.MIN_WORDS, job)
 
     def authenticate_user(self, context: ConversationContext,
                           handle_message: Callable[[ConversationContext], None]):
@@ -52,8 +56,27 @@ class UserService:
                 case ConversationStatus.SELECT_LEVEL:
                     self.select_level(context)
                     self.create_user(context.sid, context.learning_level, context.learning_lang)
-                    self.generate_words(context.learning_level, context.learning_lang)
-                    handle_message(context)
+                    self.start_when_ready(context, handle_message)
+
+    def start_when_ready(self, context: ConversationContext,
+                         handle_message: Callable[[ConversationContext], None]):
+        """
+        Start the game if the deck has words, otherwise tell the learner when the first ones
+        are stored. Never waits for the generation, the handler holds up other conversations.
+        """
+        has_words = self._db.has_word(context.learning_lang, context.learning_level)
+        job = self.generate_words(context.learning_level, context.learning_lang)
+        if has_words or (job.wait_for_first_words(0) and job.stored):
+            handle_message(context)
+            return
+
+        context.send_message(user_messages.WORDS_NOT_READY)
+        job.on_first_words(lambda finished_job: self._notify_words_ready(context, finished_job))
+
+    @staticmethod
+    def _notify_words_ready(context: ConversationContext, job: GenerationJob):
+        if job.stored:
+            context.push_message(user_messages.WORDS_READY)
 
     def select_language(self, context: ConversationContext):
         try:
@@ -0,0 +1,216 @@
+import argparse
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from constants import LearningLanguage, LearningLevel
+from db_client import DBClient
+from deepl_client import DeepLClient
+from generation_jobs import GenerationJob
+from gpt4o_mini_client import GPT4oMiniClient
+from metrics import EVENTS
+from translation_memory import TranslationMemory, normalize
+
+
+class VocabularyGenerator:
+    """
+    Fills the vocabulary of a language and level up to a given size: asks the LLM for German
+    words, skips the ones we already have, translates the rest and stores them in bulk.
+    Progress lives in the database, an interrupted run continues where it stopped.
+    In streaming mode translating and storing overlaps with the LLM reply.
+    """
+    LLM_CONCURRENCY = 2
+    TRANSLATOR_CONCURRENCY = 4
+    STORE_BATCH_SIZE = 5
+    # The LLM repeats itself, give up on a deck after this many rounds without filling it
+    MAX_ROUNDS = 5
+    PIPELINE_DEPTH = 2
+
+    def __init__(self, llm: GPT4oMiniClient, deepl: DeepLClient, db: DBClient, *,
+                 llm_concurrency: int = LLM_CONCURRENCY,
+                 translator_concurrency: int = TRANSLATOR_CONCURRENCY,
+                 store_batch_size: int = STORE_BATCH_SIZE, streaming: bool = True):
+        self._llm = llm
+        self._deepl = deepl
+        self._db = db
+        self._llm_slots = threading.BoundedSemaphore(llm_concurrency)
+        self._translator_slots = threading.BoundedSemaphore(translator_concurrency)
+        self._store_batch_size = store_batch_size
+        self._streaming = streaming
+        self._pipeline = ThreadPoolExecutor(max_workers=translator_concurrency,
+                                            thread_name_prefix="vocabulary-store")
+        self._claims: dict[str, LearningLevel] = {}
+        self._claims_lock = threading.Lock()
+
+    def fill(self, lang: LearningLanguage, level: LearningLevel, size: int,
+             job: GenerationJob | None = None) -> int:
+        """Generate words until the deck has `size` words, returns how many were added"""
+        initial_count = count = self._db.word_count(lang, level)
+        if count >= size:
+            return 0
+        if job:
+            job.set_target(size - count)
+
+        # Compared like the translation memory does: normalized, case kept
+        known_words = self._db.known_words(lang, level)
+        known = set(map(normalize, known_words))
+        # What the LLM is told to leave out, in the order the words were stored, newest last
+        excluded = list(known_words)
+        for round_number in range(VocabularyGenerator.MAX_ROUNDS):
+            # A round that only found duplicates leaves the prompt unchanged, a cached
+            # reply would bring the same duplicates again
+            use_cache = round_number == 0
+            if self._streaming:
+                self._generate_streaming(lang, level, size - count, known, excluded, job,
+                                         use_cache)
+            else:
+                self._generate(lang, level, size - count, known, excluded, job, use_cache)
+
+            count = self._db.word_count(lang, level)
+            if count >= size:
+                break
+
+        print(f"{lang} ({level}): {count - initial_count} words added, {count} in total")
+        return count - initial_count
+
+    def _generate(self, lang: LearningLanguage, level: LearningLevel, number_of_words: int,
+                  known: set[str], excluded: list[str], job: GenerationJob | None,
+                  use_cache: bool = True):
+        with self._llm_slots:
+            answer = self._llm.chat(LearningLanguage.DE, lang, level, number_of_words,
+                                    exclude=excluded, use_cache=use_cache)
+        words = [word for word in (self._llm.string_to_dict(answer) or {}).values()
+                 if isinstance(word, str)]
+
+        new_words = self._new_words(words, level, known, excluded)
+        for start in range(0, len(new_words), self._store_batch_size):
+            self._store(new_words[start:start + self._store_batch_size], lang, level, job)
+
+    def _generate_streaming(self, lang: LearningLanguage, level: LearningLevel,
+                            number_of_words: int, known: set[str], excluded: list[str],
+                            job: GenerationJob | None, use_cache: bool = True):
+        """
+        Words are translated and stored in batches while the LLM is still writing. At most
+        PIPELINE_DEPTH batches are in flight, a slow translator slows down reading the stream.
+        """
+        in_flight = threading.BoundedSemaphore(VocabularyGenerator.PIPELINE_DEPTH)
+        futures = []
+
+        def store(batch: list[str]):
+            try:
+                self._store(batch, lang, level, job)
+            finally:
+                in_flight.release()
+
+        def submit(batch: list[str]):
+            in_flight.acquire()
+            futures.append(self._pipeline.submit(store, batch))
+
+        batch = []
+        try:
+            with self._llm_slots:
+                for word in self._llm.stream_words(LearningLanguage.DE, lang, level,
+                                                   number_of_words, exclude=excluded,
+                                                   use_cache=use_cache):
+                    batch.extend(self._new_words([word], level, known, excluded))
+                    if len(batch) >= self._store_batch_size:
+                        submit(batch)
+                        batch = []
+        except Exception as e:
+            # Keep what was generated before the stream broke off
+            print(f"Error streaming words for {lang} ({level}): {e}")
+        finally:
+            if batch:
+                submit(batch)
+            for future in futures:
+                future.result()
+
+    def _new_words(self, words: list[str], level: LearningLevel, known: set[str],
+                   excluded: list[str]) -> list[str]:
+        """Drop words we already have before they cost DeepL characters or DB round-trips"""
+        words = [word for word in map(normalize, words) if word]
+        new_words = []
+        for word in words:
+            if word not in known and self._claim(word, level):
+                known.add(word)
+                excluded.append(word)
+                new_words.append(word)
+        EVENTS.inc(len(words) - len(new_words), event="generated_word_duplicate")
+        return new_words
+
+    def _store(self, batch: list[str], lang: LearningLanguage, level: LearningLevel,
+               job: GenerationJob | None):
+        with self._translator_slots:
+            translations = self._deepl.translate_texts(batch, target_lang=lang)
+        self._db.create_words(dict(zip(batch, translations)), lang, level)
+        if job:
+            job.report(len(batch))
+
+    def _claim(self, word: str, level: LearningLevel) -> bool:
+        """German words are unique, concurrent runs must not store one word on two levels"""
+        with self._claims_lock:
+            return self._claims.setdefault(word, level) == level
+
+    def fill_all(self, size: int, languages: list[LearningLanguage],
+                 levels: list[LearningLevel], *, workers: int = 4) -> dict:
+        """Fill every combination of language and level concurrently"""
+        combinations = list(itertools.product(languages, levels))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vocabulary") as executor:
+            futures = {combination: executor.submit(self.fill, *combination, size)
+                       for combination in combinations}
+
+        results = {}
+        for (lang, level), future in futures.items():
+            try:
+                results[(lang, level)] = future.result()
+            except Exception as e:
+                print(f"Error generating words for {lang} ({level}): {e}")
+                results[(lang, level)] = None
+        return results
+
+
+def main():
+    load_dotenv()
+    languages = [lang for lang in LearningLanguage if lang != LearningLanguage.DE]
+
+    parser = argparse.ArgumentParser(
+        description="Pre-generate the vocabulary of every language and level, safe to re-run"
+    )
+    parser.add_argument("--size", type=int, default=100, help="words per language and level")
+    parser.add_argument("--languages", nargs="+", default=[lang.name for lang in languages],
+                        choices=[lang.name for lang in languages])
+    parser.add_argument("--levels", nargs="+", default=[level.name for level in LearningLevel],
+                        choices=[level.name for level in LearningLevel])
+    parser.add_argument("--workers", type=int, default=4,
+                        help="language/level combinations generated at the same time")
+    parser.add_argument("--llm-concurrency", type=int,
+                        default=VocabularyGenerator.LLM_CONCURRENCY)
+    parser.add_argument("--translator-concurrency", type=int,
+                        default=VocabularyGenerator.TRANSLATOR_CONCURRENCY)
+    parser.add_argument("--no-streaming", action="store_true",
+                        help="wait for complete LLM replies instead of streaming them")
+    args = parser.parse_args()
+
+    db = DBClient(f"{os.getenv('FAST_URL')}:{os.getenv('FAST_PORT')}")
+    deepl = DeepLClient(memory=TranslationMemory(os.getenv("TRANSLATION_MEMORY", "translations.db")))
+    generator = VocabularyGenerator(
+        GPT4oMiniClient(), deepl, db,
+        llm_concurrency=args.llm_concurrency,
+        translator_concurrency=args.translator_concurrency,
+        streaming=not args.no_streaming,
+    )
+
+    results = generator.fill_all(
+        args.size,
+        [LearningLanguage.from_str(lang) for lang in args.languages],
+        [LearningLevel.from_str(level) for level in args.levels],
+        workers=args.workers,
+    )
+    for (lang, level), added in results.items():
+        print(f"{lang:<10} {level.name:<5} {'failed' if added is None else f'+{added}'}")
+
+
+if __name__ == "__main__":
+    main()
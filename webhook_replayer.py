@@ -0,0 +1,50 @@
+import argparse
+import os
+import requests
+from dotenv import load_dotenv
+from twilio.request_validator import RequestValidator
+
+from twilio_webhook import WEBHOOK_PATH
+
+load_dotenv()
+
+
+def replay(url: str, auth_token: str, conversation_sid: str, author: str,
+           messages: list[str], start_index: int = 0, *, session=requests):
+    """
+    Send signed onMessageAdded webhooks to a locally running webhook app. Start the bot with
+    TWILIO_DRY_RUN=1 to keep its replies away from Twilio. `session` is anything with a
+    requests-style post(), e.g. a FastAPI TestClient.
+    """
+    validator = RequestValidator(auth_token)
+
+    for offset, body in enumerate(messages):
+        params = {
+            "EventType": "onMessageAdded",
+            "ConversationSid": conversation_sid,
+            "MessageSid": f"IM{conversation_sid}{start_index + offset:06d}",
+            "Index": str(start_index + offset),
+            "Author": author,
+            "Body": body,
+            "Source": "SDK",
+        }
+        signature = validator.compute_signature(url, params)
+        response = session.post(url, data=params, headers={"X-Twilio-Signature": signature})
+        print(f"{params['Index']} {body!r} -> {response.status_code}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay Twilio Conversations webhooks locally")
+    parser.add_argument("messages", nargs="+", help="message bodies, e.g. '!start' 'EN' 'EASY'")
+    parser.add_argument("--url", default=f"http://127.0.0.1:8080{WEBHOOK_PATH}")
+    parser.add_argument("--conversation-sid", default="CHlocalreplay")
+    parser.add_argument("--author", default="whatsapp:+490000000000")
+    parser.add_argument("--start-index", type=int, default=0)
+    args = parser.parse_args()
+
+    replay(args.url, os.getenv("TWILIO_AUTH_TOKEN"), args.conversation_sid, args.author,
+           args.messages, args.start_index)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import random
+import threading
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import LearningLanguage, LearningLevel
+from db_client import DBClient
+
+
+class WordDeck:
+    """
+    Local supply of exercises for one language and level. Questions are served from memory,
+    the deck refills itself in the background once it runs low.
+    """
+
+    def __init__(self, fetch: Callable[[int], list[dict]], executor: ThreadPoolExecutor, *,
+                 batch_size: int, low_water_mark: int):
+        self._fetch = fetch
+        self._executor = executor
+        self._batch_size = batch_size
+        self._low_water_mark = low_water_mark
+        self._words: deque[dict] = deque()
+        self._lock = threading.Lock()
+        # One fetch at a time, learners meeting a cold deck share its first batch
+        self._fetch_lock = threading.Lock()
+        self._refilling = False
+
+    def next_word(self) -> dict:
+        with self._lock:
+            word = self._words.popleft() if self._words else None
+
+        if word is None:
+            # Only the very first question (or a drained deck) waits for the API
+            with self._fetch_lock:
+                if not self._words:
+                    self._fill()
+            with self._lock:
+                if not self._words:
+                    raise LookupError("No words available for this language and level")
+                word = self._words.popleft()
+
+        self._refill_in_background()
+        return word
+
+    def __len__(self):
+        return len(self._words)
+
+    def _refill_in_background(self):
+        with self._lock:
+            if self._refilling or len(self._words) >= self._low_water_mark:
+                return
+            self._refilling = True
+        self._executor.submit(self._refill)
+
+    def _refill(self):
+        try:
+            with self._fetch_lock:
+                self._fill()
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def _fill(self):
+        """One request for a whole batch"""
+        try:
+            words = self._fetch(self._batch_size)
+        except Exception as e:
+            print(f"Error refilling word deck: {e}")
+            raise
+
+        random.shuffle(words)
+        with self._lock:
+            queued_ids = {word.get("word_id") for word in self._words}
+            for word in words:
+                if word.get("word_id") not in queued_ids:
+                    queued_ids.add(word.get("word_id"))
+                    self._words.append(word)
+
+
+class WordDeckPool:
+    BATCH_SIZE = 20
+    LOW_WATER_MARK = 5
+    REFILL_WORKERS = 2
+
+    def __init__(self, db: DBClient, *, batch_size: int = BATCH_SIZE,
+                 low_water_mark: int = LOW_WATER_MARK):
+        self._db = db
+        self._batch_size = batch_size
+        self._low_water_mark = low_water_mark
+        self._executor = ThreadPoolExecutor(max_workers=WordDeckPool.REFILL_WORKERS,
+                                            thread_name_prefix="word-deck")
+        self._decks: dict[tuple[LearningLanguage, LearningLevel], WordDeck] = {}
+        self._lock = threading.Lock()
+
+    def next_word(self, lang: LearningLanguage, level: LearningLevel) -> dict:
+        return self.get_deck(lang, level).next_word()
+
+    def get_deck(self, lang: LearningLanguage, level: LearningLevel) -> WordDeck:
+        with self._lock:
+            deck = self._decks.get((lang, level))
+            if deck is None:
+                deck = WordDeck(
+                    lambda count: self._db.get_words(lang, level, count),
+                    self._executor,
+                    batch_size=self._batch_size,
+                    low_water_mark=self._low_water_mark,
+                )
+                self._decks[(lang, level)] = deck
+            return deck